@@ -0,0 +1,234 @@
+"""Versioned JSON API.
+
+    GET /api/v1/timeline                  the logged-in user's home timeline
+    GET /api/v1/users/<id>                a user's profile
+    GET /api/v1/users/<id>/messages       a user's messages
+    GET /api/v1/messages/<id>             one message
+
+    POST   /api/v1/following              follow users
+    DELETE /api/v1/following              stop following users
+    POST   /api/v1/likes                  like messages
+    DELETE /api/v1/likes                  stop liking messages
+
+Message lists are newest first, 100 to a page; the response's `next` is
+the cursor to pass as `?before=` for the page after it (null on the last
+page). `?fields=id,text` picks which fields each item has.
+
+Rows are selected as plain column tuples, not ORM objects, through the same
+query functions the HTML views use (`timeline.home_timeline()` and
+`timeline.user_timeline()`), and serialized straight to JSON.
+
+The batch endpoints take a JSON body `{"ids": [...]}` of up to 100 user or
+message ids, apply them all in one transaction (see bulk.py), and return
+`{"results": [{"id": ..., "result": ...}, ...]}` in the order given.
+"""
+
+from flask import Blueprint, abort, g, jsonify, request
+from werkzeug.exceptions import HTTPException
+
+from models import db, Message, User
+from pagination import PER_PAGE, Page, decode_cursor
+from ratelimit import limit_changes
+import bulk
+import followgraph
+import timeline
+import usercache
+
+bp = Blueprint('api', __name__, url_prefix='/api/v1')
+
+MESSAGE_FIELDS = {
+    'id': Message.id,
+    'text': Message.text,
+    'timestamp': Message.timestamp,
+    'user_id': Message.user_id,
+    'like_count': Message.like_count,
+    'username': User.username,
+    'image_url': User.image_url,
+}
+DEFAULT_MESSAGE_FIELDS = list(MESSAGE_FIELDS)
+
+# Fields that need the author's row.
+AUTHOR_FIELDS = {'username', 'image_url'}
+
+USER_FIELDS = {
+    column: getattr(User, column)
+    for column in ['id', 'username', 'image_url', 'header_image_url', 'bio',
+                   'location', 'messages_count', 'following_count',
+                   'followers_count', 'likes_count']
+}
+DEFAULT_USER_FIELDS = list(USER_FIELDS)
+
+
+def requested_fields(available, default):
+    """The `?fields=` the client asked for; 400 if any is unknown."""
+
+    if 'fields' not in request.args:
+        return default
+
+    fields = [field for field in request.args['fields'].split(',') if field]
+    unknown = [field for field in fields if field not in available]
+    if unknown:
+        abort(400, f"Unknown fields: {', '.join(unknown)}")
+    return fields
+
+
+def serialize(row, fields):
+    """A dict of `fields` from a row of columns."""
+
+    item = {}
+    for field in fields:
+        value = getattr(row, field)
+        item[field] = value.isoformat() if field == 'timestamp' else value
+    return item
+
+
+def message_rows(fields):
+    """Query for the columns behind `fields`, plus the (timestamp, id) key
+    that paging needs."""
+
+    selected = list(dict.fromkeys(['id', 'timestamp', *fields]))
+    query = (db.session
+             .query(*[MESSAGE_FIELDS[field].label(field)
+                      for field in selected])
+             .select_from(Message))
+    if AUTHOR_FIELDS.intersection(fields):
+        query = query.join(User, User.id == Message.user_id)
+    return query
+
+
+def message_page(rows, fields):
+    page = Page(rows)
+    return jsonify(messages=[serialize(row, fields) for row in page],
+                   next=page.next_cursor)
+
+
+@bp.errorhandler(HTTPException)
+def error(e):
+    return jsonify(error=e.description), e.code
+
+
+@bp.route('/timeline')
+def home_timeline():
+    """The logged-in user's home timeline."""
+
+    if not g.user:
+        abort(401, "Log in to see your timeline.")
+
+    fields = requested_fields(MESSAGE_FIELDS, DEFAULT_MESSAGE_FIELDS)
+    before = decode_cursor(request.args.get('before'))
+    rows = timeline.home_timeline(g.user.id, before=before,
+                                  limit=PER_PAGE + 1,
+                                  messages=message_rows(fields))
+    return message_page(rows, fields)
+
+
+@bp.route('/users/<int:user_id>')
+def user(user_id):
+    """A user's profile and counts."""
+
+    fields = requested_fields(USER_FIELDS, DEFAULT_USER_FIELDS)
+    row = (db.session
+           .query(*[USER_FIELDS[field].label(field) for field in fields])
+           .filter(User.id == user_id)
+           .first())
+    if row is None:
+        abort(404, "No such user.")
+
+    return jsonify(serialize(row, fields))
+
+
+@bp.route('/users/<int:user_id>/messages')
+def user_messages(user_id):
+    """A user's messages."""
+
+    fields = requested_fields(MESSAGE_FIELDS, DEFAULT_MESSAGE_FIELDS)
+    before = decode_cursor(request.args.get('before'))
+    rows = timeline.user_timeline(user_id, before=before,
+                                  limit=PER_PAGE + 1,
+                                  messages=message_rows(fields))
+
+    # An empty first page may mean there's no such user.
+    if not rows and before is None:
+        if not db.session.query(User.id).filter(User.id == user_id).first():
+            abort(404, "No such user.")
+
+    return message_page(rows, fields)
+
+
+@bp.route('/messages/<int:message_id>')
+def message(message_id):
+    """One message."""
+
+    fields = requested_fields(MESSAGE_FIELDS, DEFAULT_MESSAGE_FIELDS)
+    row = message_rows(fields).filter(Message.id == message_id).first()
+    if row is None:
+        abort(404, "No such message.")
+
+    return jsonify(serialize(row, fields))
+
+
+def batch_ids():
+    """The ids in a batch request's JSON body; 400 unless it's a list of
+    at most MAX_BATCH integers."""
+
+    body = request.get_json(silent=True)
+    ids = body.get('ids') if isinstance(body, dict) else None
+
+    if (not isinstance(ids, list)
+            or not all(type(id) is int for id in ids)):
+        abort(400, 'Send a JSON body like {"ids": [1, 2, 3]}.')
+    if len(ids) > bulk.MAX_BATCH:
+        abort(400, f"At most {bulk.MAX_BATCH} ids per request.")
+
+    return list(dict.fromkeys(ids))
+
+
+def apply_batch(change, committed=None):
+    """Run `change(user_id, ids)` for the logged-in user and commit.
+
+    `committed(user_id, results)`, if given, runs after the commit.
+    """
+
+    if not g.user:
+        abort(401, "Log in to make changes.")
+
+    ids = batch_ids()
+    results = change(g.user.id, ids) if ids else {}
+    db.session.commit()
+    usercache.cache.invalidate(g.user.id)
+    if committed:
+        committed(g.user.id, results)
+
+    return jsonify(results=[{'id': id, 'result': results[id]} for id in ids])
+
+
+@bp.route('/following', methods=['POST'])
+@limit_changes
+def follow():
+    """Follow each of the users in the batch."""
+
+    return apply_batch(bulk.follow, followgraph.graph.apply)
+
+
+@bp.route('/following', methods=['DELETE'])
+@limit_changes
+def unfollow():
+    """Stop following each of the users in the batch."""
+
+    return apply_batch(bulk.unfollow, followgraph.graph.apply)
+
+
+@bp.route('/likes', methods=['POST'])
+@limit_changes
+def like():
+    """Like each of the messages in the batch."""
+
+    return apply_batch(bulk.like)
+
+
+@bp.route('/likes', methods=['DELETE'])
+@limit_changes
+def unlike():
+    """Stop liking each of the messages in the batch."""
+
+    return apply_batch(bulk.unlike)
@@ -1,11 +1,30 @@
 import os
 
-from flask import Flask, render_template, request, flash, redirect, session, g
+import click
+from flask import Flask, render_template, request, flash, redirect, session, g, jsonify, url_for
 from flask_debugtoolbar import DebugToolbarExtension
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy import and_, or_, not_
+from sqlalchemy.orm import load_only
 from forms import UserAddForm, LoginForm, MessageForm, EditUserForm, AddLikesForm
-from models import db, connect_db, User, Message, Likes
+from models import db, connect_db, User, Message, Likes, Follows
+import api
+import counters
+import explain
+import followgraph
+import fragments
+import httpcache
+import instrumentation
+import migrate
+import pagecache
+import passwords
+import ratelimit
+import recommendations
+import search
+import timeline
+import usercache
+from pagination import PER_PAGE, Page, decode_cursor, older_than
+from ratelimit import limit_changes
 
 CURR_USER_KEY = "curr_user"
 
@@ -20,9 +39,60 @@ app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 app.config['SQLALCHEMY_ECHO'] = False
 app.config['DEBUG_TB_INTERCEPT_REDIRECTS'] = True
 app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', "it's a secret")
+
+# Authors with more followers than this are merged into home timelines at
+# read time instead of being fanned out to every follower on write.
+app.config['TIMELINE_FANOUT_LIMIT'] = int(
+    os.environ.get('TIMELINE_FANOUT_LIMIT', timeline.DEFAULT_FANOUT_LIMIT))
+
+# The logged-in user is cached per process for this many seconds (see
+# usercache.py) rather than loaded from the database on every request.
+app.config['USER_CACHE_TTL'] = int(
+    os.environ.get('USER_CACHE_TTL', usercache.DEFAULT_TTL))
+
+# Per-request query counts and timings, reported in a Server-Timing header
+# and at /admin/metrics (see instrumentation.py).
+app.config['INSTRUMENTATION_ENABLED'] = (
+    os.environ.get('INSTRUMENTATION_ENABLED') == '1')
+
+# bcrypt cost for new password hashes, and the pool that computes them
+# (see passwords.py).
+app.config['BCRYPT_LOG_ROUNDS'] = int(
+    os.environ.get('BCRYPT_LOG_ROUNDS', passwords.DEFAULT_ROUNDS))
+app.config['PASSWORD_HASH_WORKERS'] = int(
+    os.environ.get('PASSWORD_HASH_WORKERS', os.cpu_count()))
+
+# Token-bucket limits on logins, signups and changes (see ratelimit.py).
+app.config['RATELIMIT_ENABLED'] = (
+    os.environ.get('RATELIMIT_ENABLED', '1') == '1')
+
+# Who follows whom is held in memory (see followgraph.py) and reloaded
+# from the database after this many seconds.
+app.config['FOLLOW_GRAPH_TTL'] = int(
+    os.environ.get('FOLLOW_GRAPH_TTL', followgraph.DEFAULT_TTL))
+
+# Rendered message items and user cards kept per process (see
+# fragments.py).
+app.config['FRAGMENT_CACHE_SIZE'] = int(
+    os.environ.get('FRAGMENT_CACHE_SIZE', fragments.DEFAULT_SIZE))
+
+# Public pages are cached whole for anonymous visitors for this many
+# seconds (see pagecache.py).
+app.config['PAGE_CACHE_TTL'] = int(
+    os.environ.get('PAGE_CACHE_TTL', pagecache.DEFAULT_TTL))
 toolbar = DebugToolbarExtension(app)
 
 connect_db(app)
+usercache.cache.init_app(app)
+passwords.hasher.init_app(app)
+ratelimit.limiter.init_app(app)
+followgraph.graph.init_app(app)
+fragments.cache.init_app(app)
+# Before add_user_to_g, so cached pages are served without loading a user.
+pagecache.cache.init_app(app, CURR_USER_KEY)
+instrumentation.init_app(app)
+app.jinja_env.globals['static_url'] = httpcache.static_url
+app.register_blueprint(api.bp)
 
 
 ##############################################################################
@@ -30,10 +100,14 @@ connect_db(app)
 
 @app.before_request
 def add_user_to_g():
-    """If we're logged in, add curr user to Flask global."""
+    """If we're logged in, add curr user to Flask global.
+
+    `g.user` is a cached `usercache.CurrentUser` snapshot, not a User row;
+    use `g.user.load()` to get the row.
+    """
 
     if CURR_USER_KEY in session:
-        g.user = User.query.get(session[CURR_USER_KEY])
+        g.user = usercache.cache.get(session[CURR_USER_KEY])
 
     else:
         g.user = None
@@ -45,6 +119,45 @@ def do_login(user):
     session[CURR_USER_KEY] = user.id
 
 
+def wants_json():
+    """Did the client ask for the JSON variant of a page (`?format=json`)?"""
+
+    return request.args.get('format') == 'json'
+
+
+def following_among(users):
+    """Ids of those `users` the current user follows, for listing pages."""
+
+    if not g.user:
+        return set()
+
+    return g.user.following_among(user.id for user in users)
+
+
+# The columns a user card shows (see templates/fragments.html).
+CARD_COLUMNS = (User.id, User.username, User.image_url,
+                User.header_image_url, User.bio, User.profile_version)
+
+
+def follow_page(users, listed_id):
+    """One page of `users` -- a user's `following` or `followers` -- most
+    recently followed first, as (User, created_at) rows.
+
+    `listed_id` is the follows column holding the listed users' ids. Only
+    the columns a user card shows are loaded; `?before=<cursor>` shows
+    earlier follows.
+    """
+
+    cursor = decode_cursor(request.args.get('before'))
+    rows = (older_than(users.add_columns(Follows.created_at),
+                       Follows.created_at, listed_id, cursor)
+            .options(load_only(*CARD_COLUMNS))
+            .order_by(Follows.created_at.desc(), listed_id.desc())
+            .limit(PER_PAGE + 1)
+            .all())
+    return Page(rows, key=lambda row: (row.created_at, row.User.id))
+
+
 def do_logout():
     """Logout user."""
 
@@ -52,7 +165,16 @@ def do_logout():
         del session[CURR_USER_KEY]
 
 
+@app.errorhandler(passwords.HashingBusy)
+def hashing_busy(error):
+    """Too many signups and logins are waiting on password hashing."""
+
+    return ("Too many sign-ins right now; please try again shortly.", 503,
+            {'Retry-After': '1'})
+
+
 @app.route('/signup', methods=["GET", "POST"])
+@ratelimit.limiter.limit('signup', ratelimit.SIGNUP_PER_IP, ratelimit.by_ip)
 def signup():
     """Handle user signup.
 
@@ -80,6 +202,8 @@ def signup():
             flash("Username already taken", 'danger')
             return render_template('users/signup.html', form=form)
 
+        search.refresh_user(user)
+
         do_login(user)
 
         return redirect("/")
@@ -89,6 +213,9 @@ def signup():
 
 
 @app.route('/login', methods=["GET", "POST"])
+@ratelimit.limiter.limit('login-ip', ratelimit.LOGIN_PER_IP, ratelimit.by_ip)
+@ratelimit.limiter.limit('login-username', ratelimit.LOGIN_PER_USERNAME,
+                         ratelimit.by_username)
 def login():
     """Handle user login."""
 
@@ -99,6 +226,8 @@ def login():
                                  form.password.data)
 
         if user:
+            # Saves the password if authenticate() rehashed it.
+            db.session.commit()
             do_login(user)
             flash(f"Hello, {user.username}!", "success")
             return redirect("/")
@@ -125,61 +254,145 @@ def logout():
 def list_users():
     """Page with listing of users.
 
-    Can take a 'q' param in querystring to search by that username.
+    Can take a 'q' param in querystring to search by username, location or
+    bio (see search.py). Results are paged with 'page'; the full listing
+    is paged by user id with 'after'.
     """
 
-    search = request.args.get('q')
+    query = request.args.get('q')
+    next_url = None
 
-    if not search:
-        users = User.query.all()
+    if not query:
+        users, next_after = search.list_users(
+            after=request.args.get('after', type=int))
+        if next_after:
+            next_url = url_for('list_users', after=next_after)
     else:
-        users = User.query.filter(User.username.like(f"%{search}%")).all()
+        page = request.args.get('page', 1, type=int)
+        users, has_more = search.search_users(query, page)
+        if has_more:
+            next_url = url_for('list_users', q=query, page=page + 1)
 
-    return render_template('users/index.html', users=users)
+    return render_template('users/index.html', users=users,
+                           following=following_among(users),
+                           next_url=next_url)
 
 
 @app.route('/users/<int:user_id>')
+@pagecache.cache.cached
 def users_show(user_id):
-    """Show user profile."""
+    """Show user profile.
+
+    Messages are paged newest first; `?before=<cursor>` shows older ones.
+    """
 
     user = User.query.get_or_404(user_id)
+    pagecache.tag('user', user_id)
+
+    latest = (db.session.query(Message.timestamp, Message.id)
+              .filter(Message.user_id == user_id)
+              .order_by(Message.timestamp.desc(), Message.id.desc())
+              .first())
+    response = httpcache.not_modified(
+        user.username, user.image_url, user.header_image_url, user.bio,
+        user.location, user.messages_count, user.following_count,
+        user.followers_count, user.likes_count, tuple(latest or ()),
+        request.full_path, g.user and g.user.id,
+        g.user and g.user.is_following(user),
+        last_modified=latest and latest.timestamp)
+    if response:
+        return response
+
+    cursor = decode_cursor(request.args.get('before'))
+    page = Page(timeline.user_timeline(user_id, before=cursor,
+                                       limit=PER_PAGE + 1))
 
-    # snagging messages in order from the database;
-    # user.messages won't be in order by default
-    messages = (Message
-                .query
-                .filter(Message.user_id == user_id)
-                .order_by(Message.timestamp.desc())
-                .limit(100)
-                .all())
-    return render_template('users/show.html', user=user, messages=messages)
+    if wants_json():
+        return jsonify(page.to_dict())
+
+    return render_template('users/show.html', user=user, messages=page,
+                           next_cursor=page.next_cursor)
 
 
 @app.route('/users/<int:user_id>/following')
 def show_following(user_id):
-    """Show list of people this user is following."""
+    """Show list of people this user is following, most recent first.
+
+    Paged like messages, with `?before=<cursor>`.
+    """
 
     if not g.user:
         flash("Access unauthorized.", "danger")
         return redirect("/")
 
     user = User.query.get_or_404(user_id)
-    return render_template('users/following.html', user=user)
+    page = follow_page(user.following, Follows.user_being_followed_id)
+    users = [row.User for row in page]
+    return render_template('users/following.html', user=user, users=users,
+                           following=following_among(users),
+                           next_cursor=page.next_cursor)
 
 
 @app.route('/users/<int:user_id>/followers')
 def users_followers(user_id):
-    """Show list of followers of this user."""
+    """Show list of followers of this user, most recent first.
+
+    Paged like messages, with `?before=<cursor>`.
+    """
 
     if not g.user:
         flash("Access unauthorized.", "danger")
         return redirect("/")
 
     user = User.query.get_or_404(user_id)
-    return render_template('users/followers.html', user=user)
+    page = follow_page(user.followers, Follows.user_following_id)
+    users = [row.User for row in page]
+    return render_template('users/followers.html', user=user, users=users,
+                           following=following_among(users),
+                           next_cursor=page.next_cursor)
+
+
+@app.route('/users/<int:user_id>/likes')
+def users_likes(user_id):
+    """Show messages this user likes.
+
+    Messages are paged newest first; `?before=<cursor>` shows older ones.
+    """
+
+    user = User.query.get_or_404(user_id)
+
+    cursor = decode_cursor(request.args.get('before'))
+    page = Page(timeline.liked_by(user_id, before=cursor,
+                                  limit=PER_PAGE + 1))
+
+    if wants_json():
+        return jsonify(page.to_dict())
+
+    return render_template('users/likes.html', user=user, messages=page,
+                           next_cursor=page.next_cursor)
+
+
+@app.route('/users/suggestions')
+def users_suggestions():
+    """Show accounts the current user might want to follow.
+
+    Suggestions are precomputed by `flask compute-recommendations`; those
+    followed since are left out.
+    """
+
+    if not g.user:
+        flash("Access unauthorized.", "danger")
+        return redirect("/")
+
+    users = recommendations.suggestions_for(g.user.id)
+    followed = following_among(users)
+    users = [user for user in users if user.id not in followed]
+    return render_template('users/suggestions.html', users=users,
+                           following=followed)
 
 
 @app.route('/users/follow/<int:follow_id>', methods=['POST'])
+@limit_changes
 def add_follow(follow_id):
     """Add a follow for the currently-logged-in user."""
 
@@ -188,13 +401,21 @@ def add_follow(follow_id):
         return redirect("/")
 
     followed_user = User.query.get_or_404(follow_id)
-    g.user.following.append(followed_user)
-    db.session.commit()
+
+    if not g.user.is_following(followed_user):
+        db.session.add(Follows(user_being_followed_id=followed_user.id,
+                               user_following_id=g.user.id))
+        counters.follow(g.user.id, followed_user.id)
+        timeline.add_follow(g.user.id, followed_user.id)
+        db.session.commit()
+        usercache.cache.invalidate(g.user.id)
+        followgraph.graph.follow(g.user.id, [followed_user.id])
 
     return redirect(f"/users/{g.user.id}/following")
 
 
 @app.route('/users/stop-following/<int:follow_id>', methods=['POST'])
+@limit_changes
 def stop_following(follow_id):
     """Have currently-logged-in-user stop following this user."""
 
@@ -202,14 +423,23 @@ def stop_following(follow_id):
         flash("Access unauthorized.", "danger")
         return redirect("/")
 
-    followed_user = User.query.get(follow_id)
-    g.user.following.remove(followed_user)
-    db.session.commit()
+    removed = (Follows.query
+               .filter_by(user_being_followed_id=follow_id,
+                          user_following_id=g.user.id)
+               .delete())
+
+    if removed:
+        counters.follow(g.user.id, follow_id, delta=-1)
+        timeline.remove_follow(g.user.id, follow_id)
+        db.session.commit()
+        usercache.cache.invalidate(g.user.id)
+        followgraph.graph.unfollow(g.user.id, [follow_id])
 
     return redirect(f"/users/{g.user.id}/following")
 
 
 @app.route("/users/add_like/<int:msg_id>", methods=['POST'])
+@limit_changes
 def add_like(msg_id):
     """Have currently-logged-in-user like a message."""
 
@@ -217,29 +447,37 @@ def add_like(msg_id):
         flash("Access unauthorized.", "danger")
         return redirect("/")
 
-    if msg_id in [msg.id for msg in g.user.messages]:
+    msg = Message.query.get_or_404(msg_id)
+    if msg.user_id == g.user.id or Likes.query.get((g.user.id, msg.id)):
         return redirect("/")
 
     new_like = Likes(user_id=g.user.id, message_id=msg_id)
     db.session.add(new_like)
+    counters.like(g.user.id, [msg_id])
     db.session.commit()
+    usercache.cache.invalidate(g.user.id)
     return redirect("/")
 
 
 @app.route("/users/remove_like/<int:msg_id>", methods=['POST'])
+@limit_changes
 def remove_like(msg_id):
     """Have currently-logged-in-user un-like a message."""
 
     if not g.user:
         flash("Access unauthorized.", "danger")
         return redirect("/")
-    Likes.query.filter(
+    removed = Likes.query.filter(
         and_(Likes.user_id == g.user.id, Likes.message_id == msg_id)).delete()
+    if removed:
+        counters.like(g.user.id, [msg_id], delta=-1)
     db.session.commit()
+    usercache.cache.invalidate(g.user.id)
     return redirect("/")
 
 
 @app.route('/users/profile', methods=["GET", "POST"])
+@limit_changes
 def profile():
     """Update profile for current user."""
 
@@ -264,22 +502,26 @@ def profile():
         bio = form.bio.data
         location = form.location.data
         password = form.password.data
-        if User.authenticate(user.username, password):
+        if passwords.hasher.check(user.password, password):
             user.email = email
             user.username = username
             user.image_url = image_url or user.image_url or "/static/images/default.jpg"
             user.header_image_url = header_image_url or user.header_image_url or "/static/images/warbler-hero.jpg"
             user.bio = bio
             user.location = location
+            user.profile_version = User.profile_version + 1
             try:
                 db.session.add(user)
                 db.session.commit()
+                usercache.cache.invalidate(user.id)
+                fragments.cache.invalidate('user', user.id)
+                pagecache.cache.invalidate('user', user.id)
+                search.refresh_user(user)
             except:
                 db.session.rollback()
                 return "fail"
             else:
-                render_template('users/edit.html', form=form,
-                                user_id=session[CURR_USER_KEY])
+                return redirect(f"/users/{user.id}")
         else:
             flash("Incorrect Password", "danger")
             return redirect("/")
@@ -289,6 +531,7 @@ def profile():
 
 
 @app.route('/users/delete', methods=["POST"])
+@limit_changes
 def delete_user():
     """Delete user."""
 
@@ -298,8 +541,16 @@ def delete_user():
 
     do_logout()
 
-    db.session.delete(g.user)
+    message_ids = [id for (id,) in db.session.query(Message.id)
+                   .filter(Message.user_id == g.user.id)]
+    counters.forget_user(g.user.id)
+    db.session.delete(g.user.load())
     db.session.commit()
+    usercache.cache.invalidate(g.user.id)
+    pagecache.cache.invalidate('user', g.user.id)
+    followgraph.graph.remove_user(g.user.id)
+    search.forget_user(g.user.id)
+    search.forget_messages(message_ids)
 
     return redirect("/signup")
 
@@ -308,6 +559,7 @@ def delete_user():
 # Messages routes:
 
 @app.route('/messages/new', methods=["GET", "POST"])
+@limit_changes
 def messages_add():
     """Add a message:
 
@@ -321,24 +573,65 @@ def messages_add():
     form = MessageForm()
 
     if form.validate_on_submit():
-        msg = Message(text=form.text.data)
-        g.user.messages.append(msg)
+        msg = Message(text=form.text.data, user_id=g.user.id)
+        db.session.add(msg)
+        db.session.flush()
+        counters.adjust(g.user.id, messages_count=1)
+        timeline.fan_out_message(msg)
         db.session.commit()
+        usercache.cache.invalidate(g.user.id)
+        pagecache.cache.invalidate('user', g.user.id)
+        search.index_message(msg)
 
         return redirect(f"/users/{g.user.id}")
 
     return render_template('messages/new.html', form=form)
 
 
+@app.route('/messages/search')
+def messages_search():
+    """Full-text search over messages.
+
+    Takes a 'q' param; results are ranked best first and paged with a
+    'before' cursor (see search.search_messages).
+    """
+
+    query = request.args.get('q', '')
+    messages, next_cursor = [], None
+
+    if query:
+        messages, next_cursor = search.search_messages(
+            query, before=search.decode_cursor(request.args.get('before')))
+
+    if wants_json():
+        return jsonify(messages=[msg.to_dict() for msg in messages],
+                       next=next_cursor)
+
+    return render_template('messages/search.html', query=query,
+                           messages=messages, next_cursor=next_cursor)
+
+
 @app.route('/messages/<int:message_id>', methods=["GET"])
+@pagecache.cache.cached
 def messages_show(message_id):
     """Show a message."""
 
-    msg = Message.query.get(message_id)
+    msg = Message.query.options(Message.with_author()).get_or_404(message_id)
+    pagecache.tag('message', message_id)
+    pagecache.tag('user', msg.user_id)
+
+    response = httpcache.not_modified(
+        msg.id, msg.text, msg.timestamp, msg.like_count, msg.user.username,
+        msg.user.image_url, g.user and g.user.id, g.user and g.user.is_following(msg.user),
+        last_modified=msg.timestamp)
+    if response:
+        return response
+
     return render_template('messages/show.html', message=msg)
 
 
 @app.route('/messages/<int:message_id>/delete', methods=["POST"])
+@limit_changes
 def messages_destroy(message_id):
     """Delete a message."""
 
@@ -347,8 +640,15 @@ def messages_destroy(message_id):
         return redirect("/")
 
     msg = Message.query.get(message_id)
+    counters.forget_message(msg.id)
+    timeline.remove_message(msg.id)
     db.session.delete(msg)
     db.session.commit()
+    usercache.cache.invalidate(msg.user_id)
+    fragments.cache.invalidate('message', message_id)
+    pagecache.cache.invalidate('message', message_id)
+    pagecache.cache.invalidate('user', msg.user_id)
+    search.forget_messages([message_id])
 
     return redirect(f"/users/{g.user.id}")
 
@@ -358,11 +658,13 @@ def messages_destroy(message_id):
 
 
 @app.route('/', methods=["GET", "POST"])
+@pagecache.cache.cached
 def homepage():
     """Show homepage:
 
     - anon users: no messages
-    - logged in: 100 most recent messages of followed_users
+    - logged in: 100 most recent messages of followed_users, with
+      `?before=<cursor>` paging back to older ones
     """
 
     if g.user:
@@ -372,37 +674,109 @@ def homepage():
         if form.validate_on_submit():
             return redirect('/')
 
-        messages = (Message
-                    .query
-                    .order_by(Message.timestamp.desc())
-                    .filter(or_(Message.user_id.in_([user.id for user in g.user.following]), Message.user_id == g.user.id))
-                    .limit(100)
-                    .all())
+        cursor = decode_cursor(request.args.get('before'))
+        page = Page(timeline.home_timeline(g.user.id, before=cursor,
+                                           limit=PER_PAGE + 1))
+
+        if wants_json():
+            return jsonify(page.to_dict())
 
-        return render_template('home.html', messages=messages, likes=[msg.id for msg in g.user.likes], user_posts=[msg.id for msg in g.user.messages], form=form)
+        likes, like_counts = Likes.for_messages([msg.id for msg in page],
+                                                g.user.id)
+        return render_template('home.html', messages=page, next_cursor=page.next_cursor, likes=likes, like_counts=like_counts, form=form)
 
     else:
         return render_template('home-anon.html')
 
 
 ##############################################################################
-# Turn off all caching in Flask
-#   (useful for dev; in production, this kind of stuff is typically
-#   handled elsewhere)
-#
-# https://stackoverflow.com/questions/34066804/disabling-caching-in-flask
+# Maintenance commands
+
+
+@app.cli.command('rebuild-timelines')
+@click.option('--user-id', type=int, help="Only rebuild this user's timeline.")
+def rebuild_timelines(user_id):
+    """Rebuild materialized home timelines from messages and follows."""
+
+    timeline.rebuild(user_id)
+    db.session.commit()
+
+
+@app.cli.command('reconcile-counters')
+def reconcile_counters():
+    """Recompute every user's message, follow and like counters."""
+
+    counters.reconcile()
+    db.session.commit()
+
+
+@app.cli.command('compute-recommendations')
+@click.option('--limit', type=int, default=recommendations.DEFAULT_LIMIT,
+              help="Suggestions kept per user.")
+def compute_recommendations(limit):
+    """Recompute every user's who-to-follow suggestions."""
+
+    written = recommendations.compute(limit)
+    db.session.commit()
+    click.echo(f"{written} suggestions written.")
+
+
+##############################################################################
+# HTTP caching (see httpcache.py)
 
 
 @app.after_request
-def add_header(req):
-    """Add non-caching headers on every request."""
+def add_header(response):
+    """Add caching headers to every response."""
 
-    req.headers["Cache-Control"] = "no-cache, no-store, must-revalidate"
-    req.headers["Pragma"] = "no-cache"
-    req.headers["Expires"] = "0"
-    req.headers['Cache-Control'] = 'public, max-age=0'
-    return req
+    return httpcache.add_cache_headers(response)
 
 
 if __name__ == "__main__":
     app.run(debug=True)
+
+
+@app.cli.command('db-upgrade')
+@click.option('--to', 'target', help="Stop after this migration version.")
+def db_upgrade(target):
+    """Apply pending schema migrations (see migrate.py)."""
+
+    migrate.upgrade(db.engine, target)
+
+
+@app.cli.command('db-downgrade')
+@click.option('--to', 'target',
+              help="Undo migrations after this version (default: the latest "
+                   "one only).")
+def db_downgrade(target):
+    """Undo schema migrations."""
+
+    migrate.downgrade(db.engine, target)
+
+
+@app.cli.command('db-status')
+def db_status():
+    """List schema migrations and whether each has been applied."""
+
+    for migration, applied in migrate.status(db.engine):
+        click.echo(f"{'applied' if applied else 'pending':8} "
+                   f"{migration.name}: {migration.description}")
+
+
+@app.cli.command('explain-views')
+@click.option('--user-id', type=int, help="View pages as this user.")
+def explain_views(user_id):
+    """EXPLAIN each page's queries, flagging sequential scans."""
+
+    flagged = 0
+    for view, url, statements in explain.explain_views(app, user_id):
+        click.echo(f"== {view} ({url}): {len(statements)} queries")
+        for statement, plan, scans in statements:
+            flagged += bool(scans)
+            click.echo(f"\n{'SEQUENTIAL SCAN ' if scans else ''}"
+                       f"{' '.join(statement.split())}")
+            for line in plan:
+                click.echo(f"  {'!!' if line in scans else '  '} {line}")
+        click.echo()
+
+    click.echo(f"{flagged} queries with sequential scans")
@@ -0,0 +1,25 @@
+"""Helpers shared by the benchmark scripts."""
+
+import subprocess
+
+
+def percentile(samples, pct):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * pct / 100))]
+
+
+def latency_summary(latencies):
+    """p50/p95/p99 of latencies given in milliseconds."""
+
+    return {f'p{pct}_ms': percentile(latencies, pct) for pct in (50, 95, 99)}
+
+
+def git_revision():
+    """The commit being benchmarked, so results can be compared."""
+
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'],
+                              capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
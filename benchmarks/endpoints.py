@@ -0,0 +1,200 @@
+"""Benchmark the hot endpoints.
+
+Run from the repo root:
+
+    python -m benchmarks.endpoints
+    python -m benchmarks.endpoints --users 10000 --messages 200000 \\
+        --follows 500000 --threads 8 --requests 2000 > results.json
+
+Generates a dataset with generator/create_csvs.py (cached under
+benchmarks/data/ by size and seed), loads it with seed.py into --database
+(by default a SQLite file next to the CSVs; PostgreSQL gives more useful
+numbers), then drives each endpoint through the Flask test client:
+
+- once single-threaded, counting the SQL statements per request with
+  `querycount.count_queries()`;
+- then from --threads threads at once, each logged in as a different
+  random user, recording every request's latency.
+
+Results are printed as JSON: per endpoint, throughput, p50/p95/p99 latency
+and queries per request, along with the dataset and commit benchmarked.
+"""
+
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import json
+import os
+import random
+import subprocess
+import sys
+from time import perf_counter
+
+from benchmarks.common import git_revision, latency_summary
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), 'data')
+
+# Fixed so that a seed always generates the same dataset.
+DATASET_NOW = '2024-01-01T00:00:00'
+
+SEARCHES = ['an', 'son', 'er', 'li', 'mar', 'ch']
+
+
+# Each scenario picks a random request for an endpoint: it returns the
+# keyword arguments for `client.open()`.
+
+def homepage(rng, dataset):
+    return {'path': '/'}
+
+
+def users_show(rng, dataset):
+    return {'path': f"/users/{rng.randint(1, dataset['users'])}"}
+
+
+def list_users(rng, dataset):
+    return {'path': '/users', 'query_string': {'q': rng.choice(SEARCHES)}}
+
+
+def add_follow(rng, dataset):
+    return {'path': f"/users/follow/{rng.randint(1, dataset['users'])}",
+            'method': 'POST'}
+
+
+def add_like(rng, dataset):
+    return {'path': f"/users/add_like/{rng.randint(1, dataset['messages'])}",
+            'method': 'POST'}
+
+
+def messages_add(rng, dataset):
+    return {'path': '/messages/new', 'method': 'POST',
+            'data': {'text': f'Benchmark warble {rng.random()}'}}
+
+
+SCENARIOS = [homepage, users_show, list_users, add_follow, add_like,
+             messages_add]
+
+
+def generate(users, messages, follows, seed):
+    """Directory of CSVs for a dataset, generating them the first time."""
+
+    data_dir = os.path.join(DATA_DIR, f'{users}-{messages}-{follows}-{seed}')
+    if not os.path.exists(os.path.join(data_dir, 'follows.csv')):
+        subprocess.run(
+            [sys.executable, 'generator/create_csvs.py',
+             '--users', str(users), '--messages', str(messages),
+             '--follows', str(follows), '--seed', str(seed),
+             '--now', DATASET_NOW, '--out-dir', data_dir],
+            check=True)
+    return data_dir
+
+
+def logged_in_client(app, user_id):
+    from app import CURR_USER_KEY
+
+    client = app.test_client()
+    with client.session_transaction() as sess:
+        sess[CURR_USER_KEY] = user_id
+    return client
+
+
+def count_scenario_queries(app, scenario, dataset, rng, samples):
+    """Average and most SQL statements per request, one request at a time."""
+
+    from querycount import count_queries
+
+    client = logged_in_client(app, rng.randint(1, dataset['users']))
+    counts = []
+    for i in range(samples):
+        with count_queries() as queries:
+            client.open(**scenario(rng, dataset))
+        counts.append(len(queries))
+
+    return {'queries_avg': sum(counts) / len(counts),
+            'queries_max': max(counts)}
+
+
+def load_scenario(app, scenario, dataset, seed, threads, requests):
+    """Run `requests` requests across `threads` threads at once."""
+
+    def worker(thread):
+        rng = random.Random(f'{seed}:{scenario.__name__}:{thread}')
+        client = logged_in_client(app, rng.randint(1, dataset['users']))
+        latencies = []
+        errors = 0
+        for i in range(thread, requests, threads):
+            started = perf_counter()
+            response = client.open(**scenario(rng, dataset))
+            latencies.append((perf_counter() - started) * 1000)
+            errors += response.status_code >= 400
+        return latencies, errors
+
+    started = perf_counter()
+    with ThreadPoolExecutor(threads) as pool:
+        results = list(pool.map(worker, range(threads)))
+    elapsed = perf_counter() - started
+
+    latencies = [ms for thread_latencies, errors in results
+                 for ms in thread_latencies]
+    return {'requests': len(latencies),
+            'errors': sum(errors for thread_latencies, errors in results),
+            'throughput_rps': len(latencies) / elapsed,
+            **latency_summary(latencies)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--messages', type=int, default=20000)
+    parser.add_argument('--follows', type=int, default=20000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--database',
+                        help='database to load and benchmark (it is emptied '
+                             'first); defaults to SQLite beside the CSVs')
+    parser.add_argument('--no-seed', action='store_true',
+                        help='benchmark the database as it is')
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--requests', type=int, default=500,
+                        help='requests per endpoint')
+    parser.add_argument('--query-samples', type=int, default=20,
+                        help='requests per endpoint to count queries over')
+    args = parser.parse_args()
+
+    data_dir = generate(args.users, args.messages, args.follows, args.seed)
+    database = args.database or (
+        f"sqlite:///{os.path.abspath(os.path.join(data_dir, 'warbler.db'))}")
+
+    # app.py reads its configuration when imported.
+    os.environ['DATABASE_URL'] = database
+    from app import app
+    import seed
+
+    app.config['WTF_CSRF_ENABLED'] = False
+
+    with app.app_context():
+        if not args.no_seed:
+            seed.seed(data_dir,
+                      checkpoint_path=os.path.join(data_dir, 'seed.json'))
+
+        dataset = {'users': args.users, 'messages': args.messages,
+                   'follows': args.follows, 'seed': args.seed}
+        rng = random.Random(args.seed)
+
+        endpoints = {}
+        for scenario in SCENARIOS:
+            endpoints[scenario.__name__] = {
+                **count_scenario_queries(app, scenario, dataset, rng,
+                                         args.query_samples),
+                **load_scenario(app, scenario, dataset, args.seed,
+                                args.threads, args.requests),
+            }
+
+    print(json.dumps({
+        'revision': git_revision(),
+        'database': app.config['SQLALCHEMY_DATABASE_URI'],
+        'dataset': dataset,
+        'threads': args.threads,
+        'endpoints': endpoints,
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,129 @@
+"""Benchmark rendering a 100-message home feed with and without the
+fragment cache.
+
+Run from the repo root:
+
+    python -m benchmarks.fragment_bench
+    python -m benchmarks.fragment_bench --authors 50 --repeat 500
+
+Fills a scratch SQLite database with --authors users posting 100 messages
+between them, and a reader following them all. Then, with the fragment
+cache off and on (warmed by one render first), it times rendering
+home.html for the reader's first page -- the template alone, from messages
+already loaded -- and whole GET / requests through the test client.
+Prints JSON with p50/p95/p99 milliseconds for each.
+"""
+
+import argparse
+import json
+import os
+import tempfile
+from time import perf_counter
+
+from benchmarks.common import git_revision, latency_summary
+
+
+def populate(authors):
+    from models import db, Follows, Message, User
+    import timeline
+
+    reader = User(username='reader', email='reader@example.com',
+                  password='unused')
+    users = [User(username=f'author{i}', email=f'author{i}@example.com',
+                  password='unused', bio='Benchmark author',
+                  location='Nowhere')
+             for i in range(authors)]
+    db.session.add_all([reader, *users])
+    db.session.flush()
+
+    db.session.add_all([Follows(user_following_id=reader.id,
+                                user_being_followed_id=user.id)
+                        for user in users])
+    db.session.add_all([Message(text=f'Benchmark warble number {i}, '
+                                     f'with a few more words <in it>.',
+                                user_id=users[i % authors].id)
+                        for i in range(100)])
+    timeline.rebuild()
+    db.session.commit()
+    return reader.id
+
+
+def time_renders(app, reader_id, repeat):
+    from flask import g, render_template
+
+    from models import Likes
+    from pagination import PER_PAGE, Page
+    import timeline
+    import usercache
+
+    with app.test_request_context('/'):
+        g.user = usercache.cache.get(reader_id)
+        page = Page(timeline.home_timeline(reader_id, limit=PER_PAGE + 1))
+        likes, like_counts = Likes.for_messages([msg.id for msg in page],
+                                                reader_id)
+
+        def render():
+            return render_template('home.html', messages=page,
+                                   next_cursor=page.next_cursor, likes=likes,
+                                   like_counts=like_counts, form=None)
+
+        render()
+        latencies = []
+        for _ in range(repeat):
+            started = perf_counter()
+            render()
+            latencies.append((perf_counter() - started) * 1000)
+    return latencies
+
+
+def time_requests(app, reader_id, repeat):
+    from app import CURR_USER_KEY
+
+    client = app.test_client()
+    with client.session_transaction() as sess:
+        sess[CURR_USER_KEY] = reader_id
+
+    client.get('/')
+    latencies = []
+    for _ in range(repeat):
+        started = perf_counter()
+        response = client.get('/')
+        latencies.append((perf_counter() - started) * 1000)
+        assert response.status_code == 200, response.status_code
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--authors', type=int, default=20)
+    parser.add_argument('--repeat', type=int, default=200)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as scratch:
+        # app.py reads its configuration when imported.
+        os.environ['DATABASE_URL'] = f'sqlite:///{scratch}/bench.db'
+        from app import app
+        from models import db
+        import fragments
+
+        results = {}
+        with app.app_context():
+            db.create_all()
+            reader_id = populate(args.authors)
+
+            for enabled in (False, True):
+                app.config['FRAGMENT_CACHE_ENABLED'] = enabled
+                fragments.cache.clear()
+                results['cached' if enabled else 'uncached'] = {
+                    'render': latency_summary(
+                        time_renders(app, reader_id, args.repeat)),
+                    'request': latency_summary(
+                        time_requests(app, reader_id, args.repeat)),
+                }
+
+    print(json.dumps({'revision': git_revision(), 'authors': args.authors,
+                      'repeat': args.repeat, 'results': results}, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+"""Benchmark login throughput by bcrypt cost.
+
+Run from the repo root:
+
+    python -m benchmarks.password_bench
+    python -m benchmarks.password_bench --costs 10 11 12 13 --threads 16
+    python -m benchmarks.password_bench --workers 0    # hash on request threads
+
+For each cost, signs up a user whose password is hashed at that cost, then
+posts /login for them from --threads threads at once through the Flask
+test client, against a scratch SQLite database. Prints JSON with logins per
+second and p50/p95/p99 latency per cost.
+"""
+
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import json
+import os
+import tempfile
+from time import perf_counter
+
+from benchmarks.common import git_revision, latency_summary
+
+
+def bench_cost(app, cost, threads, logins):
+    from models import db, User
+    import passwords
+
+    passwords.hasher.rounds = cost
+    username = f'bench{cost}'
+    User.signup(username=username, email=f'{username}@example.com',
+                password='password', image_url=None)
+    db.session.commit()
+
+    def worker(thread):
+        client = app.test_client()
+        latencies = []
+        for i in range(thread, logins, threads):
+            started = perf_counter()
+            response = client.post('/login', data={'username': username,
+                                                   'password': 'password'})
+            latencies.append((perf_counter() - started) * 1000)
+            assert response.status_code == 302, response.status_code
+        return latencies
+
+    started = perf_counter()
+    with ThreadPoolExecutor(threads) as pool:
+        latencies = [ms for thread_latencies in pool.map(worker, range(threads))
+                     for ms in thread_latencies]
+    elapsed = perf_counter() - started
+
+    return {'logins': len(latencies),
+            'logins_per_s': len(latencies) / elapsed,
+            **latency_summary(latencies)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--costs', type=int, nargs='+', default=[8, 10, 12])
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--logins', type=int, default=64,
+                        help='logins per cost')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                        help='hashing processes; 0 hashes on request threads')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as scratch:
+        # app.py reads its configuration when imported.
+        os.environ['DATABASE_URL'] = f'sqlite:///{scratch}/bench.db'
+        os.environ['PASSWORD_HASH_WORKERS'] = str(args.workers)
+        from app import app
+        from models import db
+        import passwords
+
+        app.config['WTF_CSRF_ENABLED'] = False
+
+        with app.app_context():
+            db.create_all()
+            costs = {cost: bench_cost(app, cost, args.threads, args.logins)
+                     for cost in args.costs}
+        passwords.hasher.shutdown()
+
+    print(json.dumps({
+        'revision': git_revision(),
+        'threads': args.threads,
+        'workers': args.workers,
+        'costs': costs,
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
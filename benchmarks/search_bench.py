@@ -0,0 +1,111 @@
+"""Benchmark message search.
+
+Run from the repo root:
+
+    python -m benchmarks.search_bench --messages 1000000
+    python -m benchmarks.search_bench --database
+
+The default mode builds the in-process `search.MessageIndex` over synthetic
+messages (words drawn with a Zipf-like skew from the seed CSV's vocabulary)
+and times indexing and queries. `--database` runs the same queries through
+`search.search_messages()` against DATABASE_URL, which should already be
+seeded (e.g. a PostgreSQL database loaded by seed.py with 1M messages).
+"""
+
+import argparse
+from csv import DictReader
+import json
+import random
+from time import perf_counter
+
+from benchmarks.common import percentile
+import search
+
+QUERIES = ['the', 'people', 'make decision', 'himself would', 'quickly',
+           'sport computer', 'plan arm night', 'xylophone']
+
+
+def vocabulary(path='generator/messages.csv'):
+    with open(path) as messages:
+        return sorted({word for row in DictReader(messages)
+                       for word in search.words(row['text'])})
+
+
+def synthetic_messages(count, seed):
+    """Yield (id, text) pairs of 5-25 words with a skewed word frequency."""
+
+    rng = random.Random(seed)
+    words = vocabulary()
+    rng.shuffle(words)
+    weights = [1 / rank for rank in range(1, len(words) + 1)]
+
+    for id in range(1, count + 1):
+        yield id, ' '.join(rng.choices(words, weights, k=rng.randint(5, 25)))
+
+
+def time_queries(run, repeat):
+    """Time `run(query)` for every query; latencies in milliseconds."""
+
+    results = {}
+    for query in QUERIES:
+        latencies = []
+        for _ in range(repeat):
+            started = perf_counter()
+            hits = run(query)
+            latencies.append((perf_counter() - started) * 1000)
+        results[query] = {
+            'hits': hits,
+            'p50_ms': percentile(latencies, 50),
+            'p95_ms': percentile(latencies, 95),
+        }
+    return results
+
+
+def bench_memory(count, seed, repeat):
+    index = search.MessageIndex()
+    index.loaded = True
+
+    started = perf_counter()
+    for id, text in synthetic_messages(count, seed):
+        index.add_message(id, text)
+    build_s = perf_counter() - started
+
+    def run(query):
+        return len(index.search(query)[:search.PER_PAGE])
+
+    return {'mode': 'memory', 'messages': count, 'build_s': build_s,
+            'queries': time_queries(run, repeat)}
+
+
+def bench_database(repeat):
+    from app import app
+
+    with app.app_context():
+        def run(query):
+            messages, _ = search.search_messages(query)
+            return len(messages)
+
+        return {'mode': 'database',
+                'database': app.config['SQLALCHEMY_DATABASE_URI'],
+                'queries': time_queries(run, repeat)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--messages', type=int, default=1_000_000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--database', action='store_true',
+                        help='query DATABASE_URL instead of a memory index')
+    args = parser.parse_args()
+
+    if args.database:
+        results = bench_database(args.repeat)
+    else:
+        results = bench_memory(args.messages, args.seed, args.repeat)
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,150 @@
+"""Set-based follows and likes for many ids at once.
+
+Each function applies one batch in the caller's transaction -- a single
+`INSERT ... ON CONFLICT DO NOTHING` or `DELETE ... WHERE id IN (...)` for
+the rows themselves, plus the matching counter and timeline updates -- and
+returns what happened to each id, as a dict of id -> result string. The
+caller commits.
+
+On PostgreSQL, `RETURNING` reports which rows were actually inserted or
+deleted. SQLite selects the affected ids before (and, for inserts, after)
+the statement instead.
+"""
+
+from sqlalchemy import and_
+from sqlalchemy.dialects import postgresql, sqlite
+
+from models import db, Follows, Likes, Message, User
+import counters
+import timeline
+
+# Most ids one request may pass.
+MAX_BATCH = 100
+
+
+def uses_returning():
+    return db.engine.dialect.name == 'postgresql'
+
+
+def insert_ignoring_duplicates(model, rows, returning):
+    """Insert `rows`, skipping any that already exist.
+
+    Returns the `returning` column of the rows inserted.
+    """
+
+    insert = (postgresql.insert if uses_returning() else sqlite.insert)
+    statement = insert(model).values(rows).on_conflict_do_nothing()
+
+    if uses_returning():
+        result = db.session.execute(statement.returning(returning))
+        return {value for (value,) in result}
+
+    matching = db.session.query(returning).filter(
+        *[getattr(model, key).in_({row[key] for row in rows})
+          for key in rows[0]])
+    before = {value for (value,) in matching}
+    db.session.execute(statement)
+    return {value for (value,) in matching} - before
+
+
+def delete_matching(model, condition, returning):
+    """Delete rows of `model` matching `condition`.
+
+    Returns the `returning` column of the rows deleted.
+    """
+
+    if uses_returning():
+        result = db.session.execute(
+            model.__table__.delete().where(condition).returning(returning))
+        return {value for (value,) in result}
+
+    deleted = {value for (value,) in
+               db.session.query(returning).filter(condition)}
+    db.session.execute(model.__table__.delete().where(condition))
+    return deleted
+
+
+def follow(follower_id, user_ids):
+    """Have `follower_id` follow each of `user_ids`."""
+
+    existing = {id for (id,) in
+                db.session.query(User.id).filter(User.id.in_(user_ids))}
+    results = {id: 'not_found' for id in user_ids if id not in existing}
+    if follower_id in existing:
+        results[follower_id] = 'self'
+        existing.discard(follower_id)
+
+    followed = set()
+    if existing:
+        followed = insert_ignoring_duplicates(
+            Follows,
+            [{'user_following_id': follower_id, 'user_being_followed_id': id}
+             for id in existing],
+            Follows.user_being_followed_id)
+
+    if followed:
+        counters.adjust(follower_id, following_count=len(followed))
+        counters.adjust(list(followed), followers_count=1)
+        timeline.add_follows(follower_id, followed)
+
+    for id in existing:
+        results[id] = 'followed' if id in followed else 'already_following'
+    return results
+
+
+def unfollow(follower_id, user_ids):
+    """Have `follower_id` stop following each of `user_ids`."""
+
+    unfollowed = delete_matching(
+        Follows,
+        and_(Follows.user_following_id == follower_id,
+             Follows.user_being_followed_id.in_(user_ids)),
+        Follows.user_being_followed_id)
+
+    if unfollowed:
+        counters.adjust(follower_id, following_count=-len(unfollowed))
+        counters.adjust(list(unfollowed), followers_count=-1)
+        timeline.remove_follows(follower_id, unfollowed)
+
+    return {id: 'unfollowed' if id in unfollowed else 'not_following'
+            for id in user_ids}
+
+
+def like(user_id, message_ids):
+    """Have `user_id` like each of `message_ids`."""
+
+    authors = dict(db.session.query(Message.id, Message.user_id)
+                   .filter(Message.id.in_(message_ids)))
+    results = {id: 'not_found' for id in message_ids if id not in authors}
+    results.update({id: 'own_message' for id, author in authors.items()
+                    if author == user_id})
+    likeable = [id for id, author in authors.items() if author != user_id]
+
+    liked = set()
+    if likeable:
+        liked = insert_ignoring_duplicates(
+            Likes,
+            [{'user_id': user_id, 'message_id': id} for id in likeable],
+            Likes.message_id)
+
+    if liked:
+        counters.like(user_id, liked)
+
+    for id in likeable:
+        results[id] = 'liked' if id in liked else 'already_liked'
+    return results
+
+
+def unlike(user_id, message_ids):
+    """Have `user_id` stop liking each of `message_ids`."""
+
+    unliked = delete_matching(
+        Likes,
+        and_(Likes.user_id == user_id, Likes.message_id.in_(message_ids)),
+        Likes.message_id)
+
+    if unliked:
+        counters.like(user_id, unliked, delta=-1)
+
+    return {id: 'unliked' if id in unliked else 'not_liked'
+            for id in message_ids}
@@ -0,0 +1,112 @@
+"""Maintenance of the denormalized counters on User and Message.
+
+Views call these inside the transaction that makes the change, so a counter
+commits or rolls back together with the row it counts. Updates are done as
+`count = count + n` in SQL, so concurrent requests don't lose increments.
+"""
+
+from sqlalchemy import func, select
+
+from models import Follows, Likes, Message, User
+
+# Each counter, and the column whose rows it counts per user.
+COUNTED = {
+    'messages_count': Message.user_id,
+    'following_count': Follows.user_following_id,
+    'followers_count': Follows.user_being_followed_id,
+    'likes_count': Likes.user_id,
+}
+
+
+def adjust(user_ids, **deltas):
+    """Add each of `deltas` (e.g. followers_count=1) to users `user_ids`.
+
+    `user_ids` is a single id, or any query/list usable with IN.
+    """
+
+    if isinstance(user_ids, int):
+        match = User.id == user_ids
+    else:
+        match = User.id.in_(user_ids)
+
+    User.query.filter(match).update(
+        {getattr(User, name): getattr(User, name) + delta
+         for name, delta in deltas.items()},
+        synchronize_session=False)
+
+
+def follow(follower_id, followed_id, delta=1):
+    """Count a follow (or, with delta=-1, an unfollow)."""
+
+    adjust(follower_id, following_count=delta)
+    adjust(followed_id, followers_count=delta)
+
+
+def like(user_id, message_ids, delta=1):
+    """Count `user_id` liking each of `message_ids` (or, with delta=-1,
+    unliking them)."""
+
+    message_ids = list(message_ids)
+    adjust(user_id, likes_count=delta * len(message_ids))
+    Message.query.filter(Message.id.in_(message_ids)).update(
+        {Message.like_count: Message.like_count + delta},
+        synchronize_session=False)
+
+
+def forget_message(message_id):
+    """Uncount a message about to be deleted, and the likes it takes along."""
+
+    msg = Message.query.get(message_id)
+    adjust(msg.user_id, messages_count=-1)
+    adjust(select(Likes.user_id).where(Likes.message_id == message_id),
+           likes_count=-1)
+
+
+def forget_user(user_id):
+    """Uncount everything that cascades away when `user_id` is deleted."""
+
+    adjust(select(Follows.user_being_followed_id)
+           .where(Follows.user_following_id == user_id),
+           followers_count=-1)
+    adjust(select(Follows.user_following_id)
+           .where(Follows.user_being_followed_id == user_id),
+           following_count=-1)
+
+    # The user's likes vanish too.
+    Message.query.filter(Message.id.in_(
+        select(Likes.message_id).where(Likes.user_id == user_id))).update(
+            {Message.like_count: Message.like_count - 1},
+            synchronize_session=False)
+
+    # Likes on the user's messages vanish with the messages; a liker may
+    # have liked several of them.
+    likes_of_user = (select(Likes.user_id)
+                     .join(Message, Message.id == Likes.message_id)
+                     .where(Message.user_id == user_id))
+    lost = (select(func.count())
+            .select_from(Likes)
+            .join(Message, Message.id == Likes.message_id)
+            .where(Message.user_id == user_id, Likes.user_id == User.id)
+            .scalar_subquery())
+    User.query.filter(User.id.in_(likes_of_user)).update(
+        {User.likes_count: User.likes_count - lost},
+        synchronize_session=False)
+
+
+def reconcile():
+    """Recompute every user's and message's counters from the underlying
+    tables."""
+
+    User.query.update(
+        {getattr(User, name): (select(func.count())
+                               .select_from(owner_col.table)
+                               .where(owner_col == User.id)
+                               .scalar_subquery())
+         for name, owner_col in COUNTED.items()},
+        synchronize_session=False)
+    Message.query.update(
+        {Message.like_count: (select(func.count())
+                              .select_from(Likes)
+                              .where(Likes.message_id == Message.id)
+                              .scalar_subquery())},
+        synchronize_session=False)
@@ -0,0 +1,108 @@
+"""EXPLAIN the queries behind each page, flagging sequential scans.
+
+`flask explain-views` requests each page below through the test client,
+logged in as a sample user, records every SELECT it runs, and prints the
+database's plan for each one. Plans that read a whole table (PostgreSQL's
+`Seq Scan`, SQLite's `SCAN <table>` without an index) are flagged.
+
+Run it against a seeded database: on a nearly empty one, scanning a table
+is often the cheapest plan and is flagged regardless. The like routes are
+POSTs and aren't requested; the home page runs the likes lookup for its
+messages.
+"""
+
+from sqlalchemy import event, func
+
+from models import db, Follows, Message, User
+
+# (view, URL pattern); `{user}` and `{message}` are sample ids.
+PAGES = [
+    ('homepage', '/'),
+    ('users_show', '/users/{user}'),
+    ('show_following', '/users/{user}/following'),
+    ('users_followers', '/users/{user}/followers'),
+    ('list_users', '/users?q=an'),
+    ('users_suggestions', '/users/suggestions'),
+    ('messages_show', '/messages/{message}'),
+    ('api.home_timeline', '/api/v1/timeline'),
+]
+
+
+def sample_user():
+    """The user following the most others, whose home page is busiest."""
+
+    return (db.session.query(Follows.user_following_id)
+            .group_by(Follows.user_following_id)
+            .order_by(func.count().desc())
+            .limit(1)
+            .scalar()) or db.session.query(func.min(User.id)).scalar()
+
+
+def capture_selects(client, url):
+    """The (statement, parameters) of each SELECT run by requesting `url`."""
+
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if (statement.lstrip().upper().startswith('SELECT')
+                and (statement, parameters) not in statements):
+            statements.append((statement, parameters))
+
+    event.listen(db.engine, 'before_cursor_execute', record)
+    try:
+        client.get(url)
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', record)
+
+    return statements
+
+
+def plan(statement, parameters):
+    """The query plan for a statement, as lines of text."""
+
+    with db.engine.connect() as conn:
+        if conn.dialect.name == 'postgresql':
+            return [line for (line,) in
+                    conn.exec_driver_sql(f'EXPLAIN {statement}', parameters)]
+
+        return [row[-1] for row in
+                conn.exec_driver_sql(f'EXPLAIN QUERY PLAN {statement}',
+                                     parameters)]
+
+
+def is_sequential_scan(line):
+    if 'Seq Scan' in line:
+        return True
+    line = line.strip()
+    return line.startswith('SCAN ') and 'USING' not in line
+
+
+def explain_views(app, user_id=None):
+    """Yield (view, url, [(statement, plan lines, flagged lines)])."""
+
+    from app import CURR_USER_KEY
+    import usercache
+
+    user_id = user_id or sample_user()
+    message_id = (db.session.query(Message.id)
+                  .filter(Message.user_id == user_id)
+                  .limit(1)
+                  .scalar()) or db.session.query(func.min(Message.id)).scalar()
+
+    client = app.test_client()
+    with client.session_transaction() as sess:
+        sess[CURR_USER_KEY] = user_id
+
+    for view, pattern in PAGES:
+        url = pattern.format(user=user_id, message=message_id)
+
+        # Load the logged-in user afresh, so its queries are explained too.
+        usercache.cache.clear()
+
+        explained = []
+        for statement, parameters in capture_selects(client, url):
+            lines = plan(statement, parameters)
+            explained.append(
+                (statement, lines,
+                 [line for line in lines if is_sequential_scan(line)]))
+        yield view, url, explained
@@ -0,0 +1,237 @@
+"""In-memory index of who follows whom.
+
+The follows table is held in two compact adjacency structures, one per
+direction, in the CSR layout: every user's neighbours are a sorted run of
+one `array('I')` of 4-byte ids, and a second array holds where each user's
+run starts. A graph of a million follows takes about 8 MB.
+
+- membership (`is_following`) is a binary search in one user's run;
+- degrees are run lengths;
+- intersections (`following_among`, `common_following`) look up each id of
+  the shorter sorted list in the longer one.
+
+Runs are read without copying, through memoryviews. A user whose follows
+change gets their own sorted array, rebuilt on each change, which replaces
+their run; the big arrays are never modified.
+
+The graph loads lazily, with one ordered scan of follows per direction,
+and reloads after FOLLOW_GRAPH_TTL seconds. Views update it once their
+follow changes commit. Another process's changes show up here on the next
+reload, as with the logged-in user cache.
+"""
+
+from array import array
+from bisect import bisect_left, insort
+from threading import Lock
+from time import monotonic
+
+from models import db, Follows
+
+DEFAULT_TTL = 300
+
+EMPTY = memoryview(array('I'))
+
+
+def contains(run, id):
+    """Is `id` in the sorted `run`?"""
+
+    i = bisect_left(run, id)
+    return i < len(run) and run[i] == id
+
+
+def intersect(a, b):
+    """Ids in both sorted runs `a` and `b`, in order."""
+
+    if len(a) > len(b):
+        a, b = b, a
+    return [id for id in a if contains(b, id)]
+
+
+class Adjacency:
+    """One direction of the graph: CSR arrays, plus the users changed
+    since they were built."""
+
+    def __init__(self, offsets, targets):
+        self.offsets = offsets
+        self.targets = memoryview(targets)
+        self.changed = {}
+
+    @classmethod
+    def build(cls, pairs):
+        """Build from (source, target) pairs sorted by source, then target."""
+
+        # offsets[source] is where source's run starts, and
+        # offsets[source + 1] where it ends.
+        offsets = array('I', [0])
+        targets = array('I')
+        for source, target in pairs:
+            while len(offsets) <= source:
+                offsets.append(len(targets))
+            targets.append(target)
+        offsets.append(len(targets))
+
+        return cls(offsets, targets)
+
+    def __getitem__(self, source):
+        run = self.changed.get(source)
+        if run is not None:
+            return run
+        if source + 1 >= len(self.offsets):
+            return EMPTY
+        return self.targets[self.offsets[source]:self.offsets[source + 1]]
+
+    def add(self, source, target):
+        run = array('I', self[source])
+        if not contains(run, target):
+            insort(run, target)
+            self.changed[source] = run
+
+    def discard(self, source, target):
+        run = array('I', self[source])
+        i = bisect_left(run, target)
+        if i < len(run) and run[i] == target:
+            del run[i]
+            self.changed[source] = run
+
+
+def scan(source, target):
+    """Build one direction of the graph from the follows table, e.g.
+    `scan(Follows.user_following_id, Follows.user_being_followed_id)`."""
+
+    return Adjacency.build(db.session.query(source, target)
+                           .order_by(source, target)
+                           .yield_per(10000))
+
+
+class FollowGraph:
+    """Both directions of the follows table, loaded on first use."""
+
+    def __init__(self, ttl=DEFAULT_TTL):
+        self.ttl = ttl
+        self._following = self._followers = None
+        self._expires = 0
+        # Changes made while a load is running, replayed onto its result.
+        self._pending = None
+        self._lock = Lock()
+        self._loading = Lock()
+
+    def init_app(self, app):
+        self.ttl = app.config.setdefault('FOLLOW_GRAPH_TTL', self.ttl)
+
+    def _load(self):
+        with self._lock:
+            self._pending = []
+
+        try:
+            following = scan(Follows.user_following_id,
+                             Follows.user_being_followed_id)
+            followers = scan(Follows.user_being_followed_id,
+                             Follows.user_following_id)
+        except Exception:
+            with self._lock:
+                self._pending = None
+            raise
+
+        with self._lock:
+            for change, follower_id, followed_id in self._pending:
+                change(following, follower_id, followed_id)
+                change(followers, followed_id, follower_id)
+            self._pending = None
+            self._following, self._followers = following, followers
+            self._expires = monotonic() + self.ttl
+
+    def _directions(self):
+        """(following, followers), loading or reloading them if needed.
+
+        The first load blocks other requests until it's done; a reload
+        runs in one request while the others use the old graph.
+        """
+
+        if self._following is None:
+            with self._loading:
+                if self._following is None:
+                    self._load()
+        elif self._expires <= monotonic():
+            if self._loading.acquire(blocking=False):
+                try:
+                    self._load()
+                finally:
+                    self._loading.release()
+
+        return self._following, self._followers
+
+    def following(self, user_id):
+        """Sorted ids of the users `user_id` follows."""
+
+        return self._directions()[0][user_id]
+
+    def followers(self, user_id):
+        """Sorted ids of the users following `user_id`."""
+
+        return self._directions()[1][user_id]
+
+    def following_count(self, user_id):
+        return len(self.following(user_id))
+
+    def followers_count(self, user_id):
+        return len(self.followers(user_id))
+
+    def is_following(self, follower_id, followed_id):
+        return contains(self.following(follower_id), followed_id)
+
+    def following_among(self, user_id, user_ids):
+        """Subset of `user_ids` that `user_id` follows."""
+
+        return set(intersect(sorted(set(user_ids)), self.following(user_id)))
+
+    def common_following(self, user_id, other_id):
+        """Ids of the users `user_id` follows who also follow `other_id`."""
+
+        return intersect(self.following(user_id), self.followers(other_id))
+
+    # Updates, made once the change to the follows table has committed.
+
+    def _change(self, change, follower_id, followed_ids):
+        with self._lock:
+            if self._following is not None:
+                for followed_id in followed_ids:
+                    change(self._following, follower_id, followed_id)
+                    change(self._followers, followed_id, follower_id)
+            if self._pending is not None:
+                self._pending.extend((change, follower_id, followed_id)
+                                     for followed_id in followed_ids)
+
+    def follow(self, follower_id, followed_ids):
+        """Record that `follower_id` now follows each of `followed_ids`."""
+
+        self._change(Adjacency.add, follower_id, followed_ids)
+
+    def unfollow(self, follower_id, followed_ids):
+        """Record that `follower_id` no longer follows `followed_ids`."""
+
+        self._change(Adjacency.discard, follower_id, followed_ids)
+
+    def apply(self, follower_id, results):
+        """Record the outcome of a `bulk.follow()` or `bulk.unfollow()`."""
+
+        self.follow(follower_id, [id for id, result in results.items()
+                                  if result == 'followed'])
+        self.unfollow(follower_id, [id for id, result in results.items()
+                                    if result == 'unfollowed'])
+
+    def remove_user(self, user_id):
+        """Drop every follow to and from a deleted user."""
+
+        for follower_id in list(self.followers(user_id)):
+            self.unfollow(follower_id, [user_id])
+        self.unfollow(user_id, list(self.following(user_id)))
+
+    def clear(self):
+        """Forget the graph; the next use reloads it."""
+
+        with self._lock:
+            self._following = self._followers = None
+            self._expires = 0
+
+
+graph = FollowGraph()
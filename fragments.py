@@ -0,0 +1,109 @@
+"""Cache of rendered template fragments: message items and user cards.
+
+A message's HTML depends only on the message, which never changes, and on
+its author's username and image; a user card depends only on the user's
+profile. Templates wrap such a fragment in
+
+    {% call cache('message', msg.id, msg.user.profile_version) %}
+      ...
+    {% endcall %}
+
+and it is rendered once, then served from the cache until the version
+changes. `User.profile_version` goes up whenever the user edits their
+profile, so every fragment showing the old profile misses on its next
+render, in every process -- nothing has to find and delete them. Arguments
+after the version pick a variant of the fragment, e.g. the Follow or
+Unfollow button on a user card; each object keeps the variants of its
+current version together.
+
+Fragments live in a backend. `LocalBackend` is an LRU dict in this process;
+a backend shared by every app process (e.g. memcached) needs the same
+`get`, `set`, `delete` and `clear` methods. `invalidate()` deletes an
+object's fragments early, when it is deleted or changes.
+"""
+
+from collections import OrderedDict
+from threading import Lock
+
+from flask import current_app
+from markupsafe import Markup
+
+DEFAULT_SIZE = 10000
+
+
+class LocalBackend:
+    """Fragments held in this process, least recently used evicted first."""
+
+    def __init__(self, size=DEFAULT_SIZE):
+        self.size = size
+        self._values = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._values.get(key)
+            if value is not None:
+                self._values.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._values[key] = value
+            self._values.move_to_end(key)
+            while len(self._values) > self.size:
+                self._values.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._values.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+
+class FragmentCache:
+    """Rendered fragments keyed by (kind, id), versioned."""
+
+    def __init__(self, backend=None):
+        self.backend = backend or LocalBackend()
+
+    def init_app(self, app):
+        app.config.setdefault('FRAGMENT_CACHE_ENABLED', True)
+        if isinstance(self.backend, LocalBackend):
+            self.backend.size = app.config.setdefault(
+                'FRAGMENT_CACHE_SIZE', self.backend.size)
+        app.jinja_env.globals['cache'] = self.render
+
+    def render(self, kind, id, version, *variant, caller):
+        """Jinja `{% call cache(kind, id, version, ...) %}` block: the
+        cached HTML, or the block's body rendered and cached."""
+
+        if not current_app.config.get('FRAGMENT_CACHE_ENABLED', True):
+            return caller()
+
+        key = f'{kind}:{id}'
+        entry = self.backend.get(key)
+        if entry is not None and entry[0] == version:
+            html = entry[1].get(variant)
+            if html is not None:
+                return Markup(html)
+            variants = dict(entry[1])
+        else:
+            variants = {}
+
+        html = caller()
+        variants[variant] = str(html)
+        self.backend.set(key, (version, variants))
+        return html
+
+    def invalidate(self, kind, id):
+        """Forget every cached fragment of one object."""
+
+        self.backend.delete(f'{kind}:{id}')
+
+    def clear(self):
+        self.backend.clear()
+
+
+cache = FragmentCache()
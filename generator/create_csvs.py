@@ -2,15 +2,34 @@
 
 Students won't need to run this for the exercise; they will just use the CSV
 files that this generates. You should only need to run this if you wanted to
-tweak the CSV formats or generate fewer/more rows.
+tweak the CSV formats or generate fewer/more rows:
+
+    python generator/create_csvs.py --users 1000000 --messages 100000000 \\
+        --follows 50000000 --out-dir big/
+
+The same --seed always produces the same files, however many --workers
+write them. Rows are generated in fixed-size shards, each with its own
+random state, by a pool of worker processes; the shards are then joined
+into one CSV per table, ready for seed.py.
+
+Follows are sampled without ever listing all possible pairs: each shard
+picks followers from its own range of user ids and followed users from a
+power-law distribution, so memory grows with the number of follows, not
+users squared, and a few users end up with most of the followers.
 """
 
+import argparse
 import csv
-from random import choice, randint, sample
-from itertools import permutations
-import requests
+from datetime import datetime
+from functools import partial
+from multiprocessing import Pool
+import os
+import random
+import shutil
+
 from faker import Faker
-from helpers import get_random_datetime
+from helpers import (HEADER_IMAGE_URLS, IMAGE_URLS, get_random_datetime,
+                     power_law)
 
 MAX_WARBLER_LENGTH = 140
 
@@ -22,56 +41,160 @@ NUM_USERS = 300
 NUM_MESSAGES = 1000
 NUM_FOLLWERS = 5000
 
-fake = Faker()
+SHARD_ROWS = 100000
+
+PASSWORD = '$2b$12$Q1PUFjhN/AWRQ21LbGYvjeLpZZB6lfZ1BPwifHALGO6oIbyC3CmJe'
+
+
+class Generator:
+    """Writes shards of one dataset; one per worker process."""
+
+    def __init__(self, args):
+        self.args = args
+        self.now = datetime.fromisoformat(args.now)
+
+        # Which users are most followed, and which post most, as lists of
+        # user ids in decreasing order of popularity.
+        self.popular = self.ranking('popular')
+        self.active = self.ranking('active')
+
+    def ranking(self, name):
+        ids = list(range(1, self.args.users + 1))
+        random.Random(f'{self.args.seed}:{name}').shuffle(ids)
+        return ids
+
+    def shard(self, table, number):
+        """Random state and Faker for one shard, independent of the rest."""
+
+        rng = random.Random(f'{self.args.seed}:{table}:{number}')
+        fake = Faker()
+        fake.seed_instance(f'{self.args.seed}:{table}:{number}')
+        return rng, fake
+
+    def users(self, number, start, stop):
+        rng, fake = self.shard('users', number)
+
+        for id in range(start + 1, stop + 1):
+            # Suffixing the id keeps usernames and emails unique.
+            name, domain = fake.email().split('@')
+            yield (
+                f'{name}{id}@{domain}',
+                f'{fake.user_name()}{id}',
+                rng.choice(IMAGE_URLS),
+                PASSWORD,
+                fake.sentence(),
+                rng.choice(HEADER_IMAGE_URLS),
+                fake.city(),
+            )
+
+    def messages(self, number, start, stop):
+        rng, fake = self.shard('messages', number)
+
+        for i in range(start, stop):
+            yield (
+                fake.paragraph()[:MAX_WARBLER_LENGTH],
+                get_random_datetime(rng=rng, now=self.now),
+                self.active[power_law(rng, self.args.users) - 1],
+            )
+
+    def follows(self, number, start, stop):
+        """Follows made by users start+1 to stop, their share of the total."""
+
+        rng, fake = self.shard('follows', number)
+        users = self.args.users
+        count = (self.args.follows * stop // users
+                 - self.args.follows * start // users)
+
+        pairs = set()
+        while len(pairs) < count:
+            follower = rng.randint(start + 1, stop)
+            followed = self.popular[
+                power_law(rng, users, self.args.exponent) - 1]
+            if followed != follower:
+                pairs.add((follower, followed))
+
+        for follower, followed in sorted(pairs):
+            yield followed, follower
+
+
+generator = None
+
 
-# Generate random profile image URLs to use for users
+def start_worker(args):
+    global generator
+    generator = Generator(args)
 
-image_urls = [
-    f"https://randomuser.me/api/portraits/{kind}/{i}.jpg"
-    for kind, count in [("lego", 10), ("men", 100), ("women", 100)]
-    for i in range(count)
-]
 
-# Generate random header image URLs to use for users
+def write_shard(out_dir, task):
+    table, number, start, stop = task
+    path = os.path.join(out_dir, f'{table}.csv.{number:06d}')
 
-header_image_urls = [
-    requests.get(f"http://www.splashbase.co/api/v1/images/{i}").json()['url']
-    for i in range(1, 46)
-]
+    with open(path, 'w', newline='') as shard:
+        csv.writer(shard).writerows(
+            getattr(generator, table)(number, start, stop))
 
-with open('generator/users.csv', 'w') as users_csv:
-    users_writer = csv.DictWriter(users_csv, fieldnames=USERS_CSV_HEADERS)
-    users_writer.writeheader()
+    return path
 
-    for i in range(NUM_USERS):
-        users_writer.writerow(dict(
-            email=fake.email(),
-            username=fake.user_name(),
-            image_url=choice(image_urls),
-            password='$2b$12$Q1PUFjhN/AWRQ21LbGYvjeLpZZB6lfZ1BPwifHALGO6oIbyC3CmJe',
-            bio=fake.sentence(),
-            header_image_url=choice(header_image_urls),
-            location=fake.city()
-        ))
 
-with open('generator/messages.csv', 'w') as messages_csv:
-    messages_writer = csv.DictWriter(messages_csv, fieldnames=MESSAGES_CSV_HEADERS)
-    messages_writer.writeheader()
+def shards(table, total, per_shard):
+    """(table, number, start, stop) tasks covering rows 0 to `total`."""
 
-    for i in range(NUM_MESSAGES):
-        messages_writer.writerow(dict(
-            text=fake.paragraph()[:MAX_WARBLER_LENGTH],
-            timestamp=get_random_datetime(),
-            user_id=randint(1, NUM_USERS)
-        ))
+    return [(table, number, start, min(start + per_shard, total))
+            for number, start in enumerate(range(0, total, per_shard))]
+
+
+def join_shards(path, headers, parts):
+    with open(path, 'w', newline='') as out:
+        csv.writer(out).writerow(headers)
+        for part in parts:
+            with open(part, newline='') as shard:
+                shutil.copyfileobj(shard, out)
+            os.remove(part)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=NUM_USERS)
+    parser.add_argument('--messages', type=int, default=NUM_MESSAGES)
+    parser.add_argument('--follows', type=int, default=NUM_FOLLWERS)
+    parser.add_argument('--seed', default='0',
+                        help='same seed, same files')
+    parser.add_argument('--now', default=datetime.now().isoformat(),
+                        help='messages are dated in the two years before this')
+    parser.add_argument('--exponent', type=float, default=1.0,
+                        help='power-law exponent of follower counts')
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--shard-rows', type=int, default=SHARD_ROWS)
+    parser.add_argument('--out-dir', default='generator')
+    args = parser.parse_args()
+
+    if args.follows > args.users * (args.users - 1):
+        parser.error('more follows than pairs of users')
+
+    # Follows are sharded by follower, so each shard can check its own
+    # pairs for duplicates.
+    followers_per_shard = max(
+        1, args.shard_rows * args.users // max(args.follows, 1))
+
+    tables = [
+        ('users', USERS_CSV_HEADERS,
+         shards('users', args.users, args.shard_rows)),
+        ('messages', MESSAGES_CSV_HEADERS,
+         shards('messages', args.messages, args.shard_rows)),
+        ('follows', FOLLOWS_CSV_HEADERS,
+         shards('follows', args.users, followers_per_shard)),
+    ]
 
-# Generate follows.csv from random pairings of users
+    os.makedirs(args.out_dir, exist_ok=True)
+    write = partial(write_shard, args.out_dir)
 
-with open('generator/follows.csv', 'w') as follows_csv:
-    all_pairs = list(permutations(range(1, NUM_USERS + 1), 2))
+    with Pool(args.workers, start_worker, (args,)) as pool:
+        for table, headers, tasks in tables:
+            parts = pool.map(write, tasks, chunksize=1)
+            join_shards(os.path.join(args.out_dir, f'{table}.csv'),
+                        headers, parts)
+            print(f'{table}: {len(tasks)} shards')
 
-    users_writer = csv.DictWriter(follows_csv, fieldnames=FOLLOWS_CSV_HEADERS)
-    users_writer.writeheader()
 
-    for followed_user, follower in sample(all_pairs, NUM_FOLLWERS):
-        users_writer.writerow(dict(user_being_followed_id=followed_user, user_following_id=follower))
+if __name__ == '__main__':
+    main()
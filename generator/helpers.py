@@ -1,14 +1,55 @@
 """Support functions for CSV generation."""
 
 from datetime import datetime
-from random import uniform
+import random
 
+# Header images from splashbase, listed here so generating data doesn't
+# need the network.
+HEADER_IMAGE_URLS = [
+    f"https://splashbase.s3.amazonaws.com/unsplash/regular/"
+    f"tumblr_{key}1st5lhmo1_1280.jpg"
+    for key in """
+        mnh0n9pHJW mnh0uemhCk mnh121HEWa mnh17lfd9R mnh1d7s3UD mnh1jdFvHR
+        mnh1uhYnog mnh25vNOvI mnh29fxz11 mnh2m1hnS8 mo1h6tGOZf mo2wz2LTCs
+        mo2x3aAnRH mo2x80NkDu mo2x9xqeef mo2xbk8JUK mo2xdqmle5 mo2xfarCvW
+        mo2xgqdEFn mo2xijE2nr mopq4kHmAg mopq69jlcS mopq8fyQwI mopqamedKu
+        mopqc3ZZcz mopqdfx05t mopqfpSTPN mopqhxFulr mopqj9QUeq mopqkkwK2M
+        mp6rzyNlAN mp6s1hAudo mp6s32zb6l mp6s4dzqHA mp6s661UgK mp6s7lR1lS
+        mp6s995bvI mp6sasSvPZ mp6scv2xrZ mpp6f50W26 mpp6gwrYvm mpp6l06zXi
+        mpp6poZxE5 mpp6tjdFhf mpp6w0dxAm
+    """.split()
+]
 
-def get_random_datetime(year_gap=2):
+IMAGE_URLS = [
+    f"https://randomuser.me/api/portraits/{kind}/{i}.jpg"
+    for kind, count in [("lego", 10), ("men", 100), ("women", 100)]
+    for i in range(count)
+]
+
+
+def get_random_datetime(year_gap=2, rng=random, now=None):
     """Get a random datetime within the last few years."""
 
-    now = datetime.now()
+    now = now or datetime.now()
     then = now.replace(year=now.year - year_gap)
-    random_timestamp = uniform(then.timestamp(), now.timestamp())
+    random_timestamp = rng.uniform(then.timestamp(), now.timestamp())
 
     return datetime.fromtimestamp(random_timestamp)
+
+
+def power_law(rng, n, exponent=1.0):
+    """Random rank from 1 to `n`, where rank k has probability roughly
+    proportional to k ** -exponent.
+
+    Uses the inverse CDF of the continuous distribution, so it takes
+    constant time and memory however large `n` is.
+    """
+
+    u = rng.random()
+    if exponent == 1:
+        rank = (n + 1) ** u
+    else:
+        a = 1 - exponent
+        rank = (((n + 1) ** a - 1) * u + 1) ** (1 / a)
+
+    return min(int(rank), n)
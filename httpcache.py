@@ -0,0 +1,92 @@
+"""HTTP caching policy: static asset lifetimes and conditional GETs.
+
+Static files linked through `static_url()` carry a content hash in their
+query string, so they can be cached forever: a changed file gets a new URL.
+Other static files get a short max-age and revalidate with the ETag and
+Last-Modified headers Flask already sends for them.
+
+Pages are `private, no-cache`: browsers keep a copy but must check it
+first. Views whose content is cheap to fingerprint call `not_modified()`
+before rendering, and answer 304 Not Modified without touching the
+template when the browser's copy is still current.
+"""
+
+from functools import lru_cache
+from hashlib import sha1
+import os
+
+from flask import current_app, g, request, session, url_for
+
+# Cache lifetimes, in seconds.
+FINGERPRINTED_MAX_AGE = 365 * 24 * 60 * 60
+STATIC_MAX_AGE = 60 * 60
+
+
+@lru_cache(maxsize=None)
+def _fingerprint(path):
+    with open(path, 'rb') as f:
+        return sha1(f.read()).hexdigest()[:12]
+
+
+def static_url(filename):
+    """URL for a static file, fingerprinted with a hash of its contents."""
+
+    path = os.path.join(current_app.static_folder, filename)
+    return url_for('static', filename=filename, v=_fingerprint(path))
+
+
+def not_modified(*parts, last_modified=None):
+    """Set validators for this page and check them against the request.
+
+    `parts` are everything the rendered page depends on; they are hashed
+    into a weak ETag. Returns a 304 response if the browser's copy matches,
+    otherwise None, and the view should render as normal.
+    """
+
+    etag = sha1(repr(parts).encode('utf-8')).hexdigest()
+    if last_modified is not None:
+        last_modified = last_modified.replace(microsecond=0)
+    g.http_validators = (etag, last_modified)
+
+    # A pending flash message would be part of the page.
+    if '_flashes' in session:
+        return None
+
+    if request.if_none_match:
+        fresh = request.if_none_match.contains_weak(etag)
+    elif request.if_modified_since and last_modified:
+        fresh = last_modified <= request.if_modified_since.replace(tzinfo=None)
+    else:
+        fresh = False
+
+    if fresh:
+        return current_app.response_class(status=304)
+    return None
+
+
+def add_cache_headers(response):
+    """Set Cache-Control, and the validators from `not_modified()`."""
+
+    if request.endpoint == 'static':
+        response.cache_control.no_cache = None
+        if 'v' in request.args:
+            response.cache_control.public = True
+            response.cache_control.max_age = FINGERPRINTED_MAX_AGE
+            response.cache_control.immutable = True
+        else:
+            response.cache_control.public = True
+            response.cache_control.max_age = STATIC_MAX_AGE
+        return response
+
+    if 'Cache-Control' not in response.headers:
+        response.cache_control.private = True
+        response.cache_control.no_cache = True
+
+    validators = g.get('http_validators')
+    if validators:
+        etag, last_modified = validators
+        response.set_etag(etag, weak=True)
+        if last_modified is not None:
+            response.last_modified = last_modified
+
+    return response
@@ -0,0 +1,223 @@
+"""Per-request query counts and timings.
+
+When INSTRUMENTATION_ENABLED is set, every request records how many SQL
+statements it ran, the time spent in the database and in template rendering,
+and its slowest statement. Each response carries those numbers in a
+`Server-Timing` header (shown in browser dev tools), and `/admin/metrics`
+returns per-endpoint totals and histograms as JSON.
+
+When it is not enabled, `init_app()` registers nothing, so there is no
+per-request or per-query cost at all.
+"""
+
+from bisect import bisect_left
+from threading import Lock
+from time import perf_counter
+
+from flask import (before_render_template, g, has_request_context, jsonify,
+                   request, request_started, template_rendered)
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Histogram bucket upper bounds; the last bucket catches everything above.
+MS_BUCKETS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+SLOW_STATEMENT_CHARS = 300
+
+
+class RequestStats:
+    """Numbers gathered while handling one request."""
+
+    __slots__ = ('started', 'queries', 'db_time', 'render_time',
+                 'render_started', 'slowest', 'slowest_time')
+
+    def __init__(self):
+        self.started = perf_counter()
+        self.queries = 0
+        self.db_time = 0.0
+        self.render_time = 0.0
+        self.render_started = None
+        self.slowest = None
+        self.slowest_time = 0.0
+
+
+class Histogram:
+    """Counts of values falling into fixed buckets."""
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+
+    def add(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+
+    def to_dict(self):
+        """Bucket upper bounds and counts; the extra last count is for
+        values above the highest bound."""
+
+        return {'bounds': list(self.bounds), 'counts': self.counts}
+
+
+class EndpointMetrics:
+    """Running totals for every request to one endpoint."""
+
+    def __init__(self):
+        self.requests = 0
+        self.queries = 0
+        self.db_ms = 0.0
+        self.render_ms = 0.0
+        self.total_ms = 0.0
+        self.query_histogram = Histogram(QUERY_BUCKETS)
+        self.db_histogram = Histogram(MS_BUCKETS)
+        self.render_histogram = Histogram(MS_BUCKETS)
+        self.total_histogram = Histogram(MS_BUCKETS)
+        self.slowest = None
+        self.slowest_ms = 0.0
+
+    def add(self, stats, total_ms):
+        db_ms = stats.db_time * 1000
+        render_ms = stats.render_time * 1000
+
+        self.requests += 1
+        self.queries += stats.queries
+        self.db_ms += db_ms
+        self.render_ms += render_ms
+        self.total_ms += total_ms
+        self.query_histogram.add(stats.queries)
+        self.db_histogram.add(db_ms)
+        self.render_histogram.add(render_ms)
+        self.total_histogram.add(total_ms)
+
+        if stats.slowest_time * 1000 > self.slowest_ms:
+            self.slowest_ms = stats.slowest_time * 1000
+            self.slowest = stats.slowest
+
+    def to_dict(self):
+        return {
+            'requests': self.requests,
+            'avg_queries': self.queries / self.requests,
+            'avg_db_ms': self.db_ms / self.requests,
+            'avg_render_ms': self.render_ms / self.requests,
+            'avg_total_ms': self.total_ms / self.requests,
+            'queries': self.query_histogram.to_dict(),
+            'db_ms': self.db_histogram.to_dict(),
+            'render_ms': self.render_histogram.to_dict(),
+            'total_ms': self.total_histogram.to_dict(),
+            'slowest_statement': self.slowest,
+            'slowest_statement_ms': self.slowest_ms,
+        }
+
+
+class Metrics:
+    """Per-endpoint metrics for the whole process."""
+
+    def __init__(self):
+        self._endpoints = {}
+        self._lock = Lock()
+
+    def record(self, endpoint, stats, total_ms):
+        with self._lock:
+            metrics = self._endpoints.get(endpoint)
+            if metrics is None:
+                metrics = self._endpoints[endpoint] = EndpointMetrics()
+            metrics.add(stats, total_ms)
+
+    def to_dict(self):
+        with self._lock:
+            return {endpoint: metrics.to_dict()
+                    for endpoint, metrics in sorted(self._endpoints.items())}
+
+    def clear(self):
+        with self._lock:
+            self._endpoints.clear()
+
+
+metrics = Metrics()
+
+
+def current_stats():
+    """The stats for the request being handled, or None outside one."""
+
+    if has_request_context():
+        return g.get('request_stats')
+    return None
+
+
+def start_request(sender, **extra):
+    g.request_stats = RequestStats()
+
+
+def before_cursor_execute(conn, cursor, statement, parameters, context,
+                          executemany):
+    conn.info.setdefault('query_started', []).append(perf_counter())
+
+
+def after_cursor_execute(conn, cursor, statement, parameters, context,
+                         executemany):
+    elapsed = perf_counter() - conn.info['query_started'].pop()
+    stats = current_stats()
+    if stats is None:
+        return
+
+    stats.queries += 1
+    stats.db_time += elapsed
+    if elapsed > stats.slowest_time:
+        stats.slowest_time = elapsed
+        stats.slowest = statement[:SLOW_STATEMENT_CHARS]
+
+
+def start_render(sender, template, context, **extra):
+    stats = current_stats()
+    if stats is not None and stats.render_started is None:
+        stats.render_started = perf_counter()
+
+
+def finish_render(sender, template, context, **extra):
+    stats = current_stats()
+    if stats is not None and stats.render_started is not None:
+        stats.render_time += perf_counter() - stats.render_started
+        stats.render_started = None
+
+
+def add_server_timing(response):
+    """Report this request's numbers in a `Server-Timing` header."""
+
+    stats = current_stats()
+    if stats is None:
+        return response
+
+    total_ms = (perf_counter() - stats.started) * 1000
+    response.headers.add(
+        'Server-Timing',
+        f'db;dur={stats.db_time * 1000:.2f};desc="{stats.queries} queries", '
+        f'render;dur={stats.render_time * 1000:.2f}, '
+        f'total;dur={total_ms:.2f}')
+
+    metrics.record(request.endpoint or 'unknown', stats, total_ms)
+    return response
+
+
+def show_metrics():
+    """Per-endpoint request, query and timing metrics for this process."""
+
+    return jsonify(metrics.to_dict())
+
+
+def init_app(app):
+    """Turn on instrumentation for `app` if INSTRUMENTATION_ENABLED is set."""
+
+    if not app.config.get('INSTRUMENTATION_ENABLED'):
+        return
+
+    # request_started fires before any before_request function, so the
+    # query that loads the logged-in user is counted too.
+    request_started.connect(start_request, app)
+    before_render_template.connect(start_render, app)
+    template_rendered.connect(finish_render, app)
+    app.after_request(add_server_timing)
+
+    event.listen(Engine, 'before_cursor_execute', before_cursor_execute)
+    event.listen(Engine, 'after_cursor_execute', after_cursor_execute)
+
+    app.add_url_rule('/admin/metrics', 'show_metrics', show_metrics)
@@ -0,0 +1,158 @@
+"""Versioned schema migrations.
+
+Migrations are modules in the migrations/ package, named
+`<version>_<description>.py` and applied in version order. Each defines
+`upgrade(conn)` and `downgrade(conn)`, which get a SQLAlchemy connection.
+The versions applied so far are recorded in the `schema_migrations` table.
+
+    flask db-status                 list migrations, applied or not
+    flask db-upgrade                apply every pending migration
+    flask db-upgrade --to 0001      ...or only up to 0001
+    flask db-downgrade              undo the latest migration
+    flask db-downgrade --to 0001    ...or everything after 0001
+
+Each migration runs in its own transaction, together with the update to
+`schema_migrations`, unless it sets `TRANSACTIONAL = False` -- needed for
+PostgreSQL's `CREATE INDEX CONCURRENTLY`, which builds an index without
+blocking writes to the table but can't run inside a transaction.
+
+Databases made with `db.create_all()` (tests, seed.py) already have the
+latest schema; `stamp()` records every migration as applied to them.
+"""
+
+from datetime import datetime
+from importlib import import_module
+import pkgutil
+
+from sqlalchemy import (Column, DateTime, MetaData, String, Table, select,
+                        text)
+
+import migrations
+
+metadata = MetaData()
+
+schema_migrations = Table(
+    'schema_migrations', metadata,
+    Column('version', String(32), primary_key=True),
+    Column('applied_at', DateTime, nullable=False, default=datetime.utcnow),
+)
+
+
+class Migration:
+    """One module in migrations/."""
+
+    def __init__(self, name):
+        self.name = name
+        self.version = name.split('_', 1)[0]
+        self.module = import_module(f'migrations.{name}')
+        self.description = (self.module.__doc__ or '').strip().splitlines()[0]
+        self.transactional = getattr(self.module, 'TRANSACTIONAL', True)
+
+    def __repr__(self):
+        return f'<Migration {self.name}>'
+
+
+def available():
+    """Every migration, oldest first."""
+
+    return [Migration(module.name) for module in
+            sorted(pkgutil.iter_modules(migrations.__path__),
+                   key=lambda module: module.name)]
+
+
+def applied(engine):
+    """Versions recorded as applied."""
+
+    metadata.create_all(engine)
+    with engine.connect() as conn:
+        return {version for (version,) in
+                conn.execute(select(schema_migrations.c.version))}
+
+
+def run(engine, migration, step):
+    """Run `step` ('upgrade' or 'downgrade') of `migration` and record it."""
+
+    if not migration.transactional:
+        engine = engine.execution_options(isolation_level='AUTOCOMMIT')
+
+    with engine.connect() as conn:
+        with conn.begin():
+            getattr(migration.module, step)(conn)
+            if step == 'upgrade':
+                conn.execute(schema_migrations.insert(),
+                             {'version': migration.version})
+            else:
+                conn.execute(schema_migrations.delete().where(
+                    schema_migrations.c.version == migration.version))
+
+
+def upgrade(engine, target=None, log=print):
+    """Apply pending migrations, up to and including `target` if given."""
+
+    done = applied(engine)
+    for migration in available():
+        if target is not None and migration.version > target:
+            break
+        if migration.version not in done:
+            log(f'Applying {migration.name}: {migration.description}')
+            run(engine, migration, 'upgrade')
+
+
+def downgrade(engine, target=None, log=print):
+    """Undo migrations after `target`, or only the latest if not given."""
+
+    done = applied(engine)
+    undo = [migration for migration in reversed(available())
+            if migration.version in done
+            and (target is None or migration.version > target)]
+    if target is None:
+        undo = undo[:1]
+
+    for migration in undo:
+        log(f'Reverting {migration.name}: {migration.description}')
+        run(engine, migration, 'downgrade')
+
+
+def status(engine):
+    """(migration, is_applied) for every migration, oldest first."""
+
+    done = applied(engine)
+    return [(migration, migration.version in done)
+            for migration in available()]
+
+
+def stamp(engine):
+    """Record every migration as applied without running any."""
+
+    done = applied(engine)
+    with engine.begin() as conn:
+        for migration in available():
+            if migration.version not in done:
+                conn.execute(schema_migrations.insert(),
+                             {'version': migration.version})
+
+
+# Helpers for migrations.
+
+def _concurrently(conn):
+    """On PostgreSQL outside a transaction, build and drop indexes
+    without blocking writes to the table."""
+
+    autocommit = (conn.get_execution_options().get('isolation_level')
+                  == 'AUTOCOMMIT')
+    if conn.dialect.name == 'postgresql' and autocommit:
+        return 'CONCURRENTLY '
+    return ''
+
+
+def create_index(conn, name, table, *columns, unique=False):
+    """Create an index unless it already exists."""
+
+    unique = 'UNIQUE ' if unique else ''
+    columns = ', '.join(columns)
+    conn.execute(text(f'CREATE {unique}INDEX {_concurrently(conn)}'
+                      f'IF NOT EXISTS {name} ON {table} ({columns})'))
+
+
+def drop_index(conn, name):
+    conn.execute(text(f'DROP INDEX {_concurrently(conn)}IF EXISTS {name}'))
@@ -0,0 +1,40 @@
+"""Add indexes for the feed, profile, follow and like views.
+
+- follows(user_following_id): who a user follows -- the following page,
+  is_following checks, and the follow lookups behind the home timeline.
+  (The primary key already starts with user_being_followed_id, for the
+  followers page.)
+- likes(user_id): the logged-in user's likes, loaded on every page.
+- messages(user_id, timestamp, id): a user's messages newest first, for
+  profiles, counters and timeline backfill.
+- messages(timestamp, id): the newest messages across all users.
+- timeline_entries(owner_id, timestamp, message_id): the home page.
+- timeline_entries(message_id): removing a deleted message from every
+  timeline.
+"""
+
+from migrate import create_index, drop_index
+
+TRANSACTIONAL = False
+
+INDEXES = [
+    ('ix_follows_user_following_id', 'follows',
+     'user_following_id', 'user_being_followed_id'),
+    ('ix_likes_user_id', 'likes', 'user_id'),
+    ('ix_messages_user_timestamp', 'messages',
+     'user_id', 'timestamp DESC', 'id DESC'),
+    ('ix_messages_timestamp', 'messages', 'timestamp DESC', 'id DESC'),
+    ('ix_timeline_entries_owner_timestamp', 'timeline_entries',
+     'owner_id', 'timestamp DESC', 'message_id DESC'),
+    ('ix_timeline_entries_message_id', 'timeline_entries', 'message_id'),
+]
+
+
+def upgrade(conn):
+    for name, table, *columns in INDEXES:
+        create_index(conn, name, table, *columns)
+
+
+def downgrade(conn):
+    for name, table, *columns in reversed(INDEXES):
+        drop_index(conn, name)
@@ -0,0 +1,79 @@
+"""Key likes on (user_id, message_id), so many users can like a message.
+
+Drops the surrogate `id` column and the unique constraint on `message_id`
+(which let only one user ever like each message), makes
+(user_id, message_id) the primary key, and indexes `message_id` for
+counting a message's likes. The primary key covers lookups by user, so
+ix_likes_user_id from 0001 goes.
+
+Downgrading keeps only the earliest like of each message; run
+`flask reconcile-counters` afterwards.
+"""
+
+from sqlalchemy import text
+
+from migrate import create_index, drop_index
+
+
+def execute(conn, *statements):
+    for statement in statements:
+        conn.execute(text(statement))
+
+
+def upgrade(conn):
+    execute(conn,
+            "DELETE FROM likes WHERE user_id IS NULL OR message_id IS NULL")
+
+    if conn.dialect.name == 'postgresql':
+        execute(conn,
+                "ALTER TABLE likes DROP CONSTRAINT IF EXISTS "
+                "likes_message_id_key",
+                "ALTER TABLE likes DROP CONSTRAINT IF EXISTS likes_pkey",
+                "ALTER TABLE likes DROP COLUMN IF EXISTS id",
+                "ALTER TABLE likes ADD PRIMARY KEY (user_id, message_id)")
+    else:
+        # SQLite can't change a table's keys; copy it to a new table.
+        execute(conn,
+                "CREATE TABLE likes_new ("
+                "user_id INTEGER NOT NULL "
+                "REFERENCES users (id) ON DELETE CASCADE, "
+                "message_id INTEGER NOT NULL "
+                "REFERENCES messages (id) ON DELETE CASCADE, "
+                "PRIMARY KEY (user_id, message_id))",
+                "INSERT OR IGNORE INTO likes_new (user_id, message_id) "
+                "SELECT user_id, message_id FROM likes",
+                "DROP TABLE likes",
+                "ALTER TABLE likes_new RENAME TO likes")
+
+    drop_index(conn, 'ix_likes_user_id')
+    create_index(conn, 'ix_likes_message_id', 'likes', 'message_id')
+
+
+def downgrade(conn):
+    drop_index(conn, 'ix_likes_message_id')
+    execute(conn,
+            "DELETE FROM likes WHERE EXISTS (SELECT 1 FROM likes AS earlier "
+            "WHERE earlier.message_id = likes.message_id "
+            "AND earlier.user_id < likes.user_id)")
+
+    if conn.dialect.name == 'postgresql':
+        execute(conn,
+                "ALTER TABLE likes DROP CONSTRAINT likes_pkey",
+                "ALTER TABLE likes ADD COLUMN id SERIAL PRIMARY KEY",
+                "ALTER TABLE likes ALTER COLUMN user_id DROP NOT NULL, "
+                "ALTER COLUMN message_id DROP NOT NULL",
+                "ALTER TABLE likes ADD CONSTRAINT likes_message_id_key "
+                "UNIQUE (message_id)")
+    else:
+        execute(conn,
+                "CREATE TABLE likes_old ("
+                "id INTEGER NOT NULL PRIMARY KEY, "
+                "user_id INTEGER REFERENCES users (id) ON DELETE CASCADE, "
+                "message_id INTEGER UNIQUE "
+                "REFERENCES messages (id) ON DELETE CASCADE)",
+                "INSERT INTO likes_old (user_id, message_id) "
+                "SELECT user_id, message_id FROM likes",
+                "DROP TABLE likes",
+                "ALTER TABLE likes_old RENAME TO likes")
+
+    create_index(conn, 'ix_likes_user_id', 'likes', 'user_id')
@@ -0,0 +1,26 @@
+"""Count each message's likes in messages.like_count.
+
+Adds the column and fills it from the likes table; from then on the like
+views keep it current (see counters.py), so showing a message's likes never
+counts rows of likes.
+"""
+
+from sqlalchemy import inspect, text
+
+
+def upgrade(conn):
+    columns = {column['name']
+               for column in inspect(conn).get_columns('messages')}
+    if 'like_count' not in columns:
+        conn.execute(text("ALTER TABLE messages "
+                          "ADD COLUMN like_count INTEGER NOT NULL DEFAULT 0"))
+
+    conn.execute(text("UPDATE messages SET like_count = "
+                      "(SELECT count(*) FROM likes "
+                      "WHERE likes.message_id = messages.id) "
+                      "WHERE EXISTS (SELECT 1 FROM likes "
+                      "WHERE likes.message_id = messages.id)"))
+
+
+def downgrade(conn):
+    conn.execute(text("ALTER TABLE messages DROP COLUMN like_count"))
@@ -0,0 +1,19 @@
+"""Version users' profiles, for the fragment cache.
+
+Adds users.profile_version, which profile edits increment; cached message
+items and user cards are keyed on it (see fragments.py).
+"""
+
+from sqlalchemy import inspect, text
+
+
+def upgrade(conn):
+    columns = {column['name']
+               for column in inspect(conn).get_columns('users')}
+    if 'profile_version' not in columns:
+        conn.execute(text("ALTER TABLE users ADD COLUMN "
+                          "profile_version INTEGER NOT NULL DEFAULT 0"))
+
+
+def downgrade(conn):
+    conn.execute(text("ALTER TABLE users DROP COLUMN profile_version"))
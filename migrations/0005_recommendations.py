@@ -0,0 +1,22 @@
+"""Add the recommendations table, for who-to-follow suggestions.
+
+Each user's suggestions are rows keyed on (user_id, rank), written in
+batch by `flask compute-recommendations` (see recommendations.py).
+"""
+
+from sqlalchemy import text
+
+
+def upgrade(conn):
+    conn.execute(text(
+        "CREATE TABLE IF NOT EXISTS recommendations ("
+        "user_id INTEGER NOT NULL REFERENCES users (id) ON DELETE CASCADE, "
+        "rank INTEGER NOT NULL, "
+        "suggested_id INTEGER NOT NULL "
+        "REFERENCES users (id) ON DELETE CASCADE, "
+        "score FLOAT NOT NULL, "
+        "PRIMARY KEY (user_id, rank))"))
+
+
+def downgrade(conn):
+    conn.execute(text("DROP TABLE IF EXISTS recommendations"))
@@ -0,0 +1,43 @@
+"""Record when each follow was made, for paging follow listings.
+
+Adds follows.created_at, set to the time of the upgrade on existing rows,
+and indexes each user's follows and followers by it, so the following and
+followers pages are read a page at a time, most recent first.
+"""
+
+from sqlalchemy import inspect, text
+
+from migrate import create_index, drop_index
+
+INDEXES = [
+    ('ix_follows_following_created', 'follows',
+     'user_following_id', 'created_at DESC', 'user_being_followed_id DESC'),
+    ('ix_follows_followed_created', 'follows',
+     'user_being_followed_id', 'created_at DESC', 'user_following_id DESC'),
+]
+
+
+def upgrade(conn):
+    columns = {column['name']
+               for column in inspect(conn).get_columns('follows')}
+    if 'created_at' not in columns:
+        if conn.dialect.name == 'postgresql':
+            conn.execute(text("ALTER TABLE follows ADD COLUMN created_at "
+                              "TIMESTAMP NOT NULL DEFAULT now()"))
+        else:
+            # SQLite only adds columns with constant defaults; new rows
+            # get theirs from the model. Timestamps are written the way
+            # SQLAlchemy stores them, so they compare correctly as text.
+            conn.execute(text("ALTER TABLE follows "
+                              "ADD COLUMN created_at DATETIME"))
+            conn.execute(text("UPDATE follows SET created_at = "
+                              "strftime('%Y-%m-%d %H:%M:%f000', 'now')"))
+
+    for name, table, *columns in INDEXES:
+        create_index(conn, name, table, *columns)
+
+
+def downgrade(conn):
+    for name, table, *columns in reversed(INDEXES):
+        drop_index(conn, name)
+    conn.execute(text("ALTER TABLE follows DROP COLUMN created_at"))
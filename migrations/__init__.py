@@ -0,0 +1 @@
+"""Schema migrations, applied in order by migrate.py."""
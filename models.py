@@ -2,11 +2,13 @@
 
 from datetime import datetime
 
-from flask_bcrypt import Bcrypt
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event
 from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import joinedload
+
+import passwords
 
-bcrypt = Bcrypt()
 db = SQLAlchemy()
 
 
@@ -27,28 +29,78 @@ class Follows(db.Model):
         primary_key=True,
     )
 
+    # When the follow was made; the following and followers pages list
+    # the most recent first. The server default covers bulk loads.
+    created_at = db.Column(
+        db.DateTime,
+        nullable=False,
+        default=datetime.utcnow,
+        server_default=db.func.now(),
+    )
+
+    # The primary key serves lookups by followed user; the first index
+    # serves lookups by follower (who a user follows), and the others the
+    # following and followers pages, a page at a time.
+    __table_args__ = (
+        db.Index('ix_follows_user_following_id',
+                 'user_following_id', 'user_being_followed_id'),
+        db.Index('ix_follows_following_created',
+                 'user_following_id', created_at.desc(),
+                 user_being_followed_id.desc()),
+        db.Index('ix_follows_followed_created',
+                 'user_being_followed_id', created_at.desc(),
+                 user_following_id.desc()),
+    )
+
 
 class Likes(db.Model):
     """Mapping user likes to warbles."""
 
     __tablename__ = 'likes'
 
-    id = db.Column(
-        db.Integer,
-        primary_key=True
-    )
-
     user_id = db.Column(
         db.Integer,
-        db.ForeignKey('users.id', ondelete='cascade')
+        db.ForeignKey('users.id', ondelete='cascade'),
+        primary_key=True
     )
 
     message_id = db.Column(
         db.Integer,
         db.ForeignKey('messages.id', ondelete='cascade'),
-        unique=True
+        primary_key=True
     )
 
+    # The primary key serves lookups by user; this serves lookups by message.
+    __table_args__ = (
+        db.Index('ix_likes_message_id', 'message_id'),
+    )
+
+    @classmethod
+    def for_messages(cls, message_ids, user_id):
+        """Return (liked, counts) for the messages `message_ids`.
+
+        `liked` is the set of those messages `user_id` likes, and `counts`
+        maps each message id to its number of likes (missing if none).
+        Both come from one query: the counts from `Message.like_count`,
+        and `user_id`'s likes by primary key.
+        """
+
+        rows = (db.session
+                .query(Message.id, Message.like_count, cls.user_id)
+                .outerjoin(cls, (cls.message_id == Message.id)
+                           & (cls.user_id == user_id))
+                .filter(Message.id.in_(message_ids)))
+
+        liked = set()
+        counts = {}
+        for message_id, count, liker_id in rows:
+            if count:
+                counts[message_id] = count
+            if liker_id is not None:
+                liked.add(message_id)
+
+        return liked, counts
+
 
 class User(db.Model):
     """User in the system."""
@@ -95,21 +147,64 @@ class User(db.Model):
         nullable=False,
     )
 
+    # Denormalized counts, kept current by the views that change them (see
+    # counters.py) so pages never load whole relationships just to count.
+    messages_count = db.Column(
+        db.Integer,
+        nullable=False,
+        default=0,
+        server_default='0',
+    )
+
+    following_count = db.Column(
+        db.Integer,
+        nullable=False,
+        default=0,
+        server_default='0',
+    )
+
+    followers_count = db.Column(
+        db.Integer,
+        nullable=False,
+        default=0,
+        server_default='0',
+    )
+
+    likes_count = db.Column(
+        db.Integer,
+        nullable=False,
+        default=0,
+        server_default='0',
+    )
+
+    # Bumped on every profile edit; cached fragments that show the profile
+    # are keyed on it (see fragments.py).
+    profile_version = db.Column(
+        db.Integer,
+        nullable=False,
+        default=0,
+        server_default='0',
+    )
+
     messages = db.relationship(
         'Message', backref='user', cascade='all, delete-orphan')
 
+    # Queries rather than lists, so a popular user's followers are only
+    # ever loaded a page at a time.
     followers = db.relationship(
         "User",
         secondary="follows",
         primaryjoin=(Follows.user_being_followed_id == id),
-        secondaryjoin=(Follows.user_following_id == id)
+        secondaryjoin=(Follows.user_following_id == id),
+        lazy='dynamic',
     )
 
     following = db.relationship(
         "User",
         secondary="follows",
         primaryjoin=(Follows.user_following_id == id),
-        secondaryjoin=(Follows.user_being_followed_id == id)
+        secondaryjoin=(Follows.user_being_followed_id == id),
+        lazy='dynamic',
     )
 
     likes = db.relationship(
@@ -123,16 +218,48 @@ class User(db.Model):
     def is_followed_by(self, other_user):
         """Is this user followed by `other_user`?"""
 
-        found_user_list = [
-            user for user in self.followers if user == other_user]
-        return len(found_user_list) == 1
+        return other_user.is_following(self)
 
     def is_following(self, other_user):
         """Is this user following `other_user`?"""
 
-        found_user_list = [
-            user for user in self.following if user == other_user]
-        return len(found_user_list) == 1
+        return other_user.id in self.following_ids()
+
+    def following_ids(self):
+        """Set of ids of the users this user follows.
+
+        Loaded with one query the first time it's needed, then kept on the
+        instance (which lives for one request), so templates can check
+        follow status for any number of users without more queries.
+        """
+
+        ids = self.__dict__.get('_following_ids')
+        if ids is None:
+            ids = self._following_ids = {
+                followed_id for (followed_id,) in
+                db.session.query(Follows.user_being_followed_id)
+                .filter(Follows.user_following_id == self.id)}
+        return ids
+
+    def following_among(self, user_ids):
+        """Subset of `user_ids` that this user follows, in one query."""
+
+        if '_following_ids' in self.__dict__:
+            return self._following_ids.intersection(user_ids)
+
+        user_ids = list(user_ids)
+        if not user_ids:
+            return set()
+
+        return {followed_id for (followed_id,) in
+                db.session.query(Follows.user_being_followed_id)
+                .filter(Follows.user_following_id == self.id,
+                        Follows.user_being_followed_id.in_(user_ids))}
+
+    def forget_following_ids(self):
+        """Drop the cached following set after follows change."""
+
+        self.__dict__.pop('_following_ids', None)
 
     @classmethod
     def signup(cls, username, email, password, image_url):
@@ -144,7 +271,7 @@ class User(db.Model):
         if not password:
             raise ValueError('Password must be non-empty.')
 
-        hashed_pwd = bcrypt.generate_password_hash(password).decode('UTF-8')
+        hashed_pwd = passwords.hasher.hash(password)
 
         user = User(
             username=username,
@@ -165,18 +292,35 @@ class User(db.Model):
         and, if it finds such a user, returns that user object.
 
         If can't find matching user (or if password is wrong), returns False.
+
+        If the hash was made at a different bcrypt cost than the current
+        one, the user's password is rehashed; the caller should commit.
         """
 
         user = cls.query.filter_by(username=username).first()
 
         if user:
-            is_auth = bcrypt.check_password_hash(user.password, password)
+            is_auth = passwords.hasher.check(user.password, password)
             if is_auth:
+                if passwords.hasher.needs_rehash(user.password):
+                    user.password = passwords.hasher.hash(password)
                 return user
 
         return False
 
 
+@event.listens_for(User.following, 'append')
+@event.listens_for(User.following, 'remove')
+def following_changed(user, followed_user, initiator):
+    user.forget_following_ids()
+
+
+@event.listens_for(User.followers, 'append')
+@event.listens_for(User.followers, 'remove')
+def followers_changed(user, follower, initiator):
+    follower.forget_following_ids()
+
+
 class Message(db.Model):
     """An individual message ("warble")."""
 
@@ -195,7 +339,7 @@ class Message(db.Model):
     timestamp = db.Column(
         db.DateTime,
         nullable=False,
-        default=datetime.utcnow(),
+        default=datetime.utcnow,
     )
 
     user_id = db.Column(
@@ -204,6 +348,114 @@ class Message(db.Model):
         nullable=False,
     )
 
+    # Denormalized, like User's counts (see counters.py).
+    like_count = db.Column(
+        db.Integer,
+        nullable=False,
+        default=0,
+        server_default='0',
+    )
+
+    __table_args__ = (
+        db.Index('ix_messages_user_timestamp',
+                 'user_id', timestamp.desc(), id.desc()),
+        # For the newest messages across all users.
+        db.Index('ix_messages_timestamp', timestamp.desc(), id.desc()),
+    )
+
+    @classmethod
+    def with_author(cls):
+        """Loader option that fetches each message's author in the same
+        query, with only the columns message templates show."""
+
+        return (joinedload(cls.user)
+                .load_only(User.id, User.username, User.image_url,
+                           User.profile_version))
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'text': self.text,
+            'timestamp': self.timestamp.isoformat(),
+            'user_id': self.user_id,
+            'like_count': self.like_count,
+        }
+
+
+class TimelineEntry(db.Model):
+    """A message materialized into a user's home timeline.
+
+    Rows are written when a message is posted (fan-out-on-write), so reading
+    a home feed is a single range scan on (owner_id, timestamp).
+    """
+
+    __tablename__ = 'timeline_entries'
+
+    owner_id = db.Column(
+        db.Integer,
+        db.ForeignKey('users.id', ondelete='cascade'),
+        primary_key=True,
+    )
+
+    message_id = db.Column(
+        db.Integer,
+        db.ForeignKey('messages.id', ondelete='cascade'),
+        primary_key=True,
+    )
+
+    author_id = db.Column(
+        db.Integer,
+        db.ForeignKey('users.id', ondelete='cascade'),
+        nullable=False,
+    )
+
+    timestamp = db.Column(
+        db.DateTime,
+        nullable=False,
+    )
+
+    __table_args__ = (
+        db.Index('ix_timeline_entries_owner_timestamp',
+                 'owner_id', timestamp.desc(), message_id.desc()),
+        # For removing a deleted message from every timeline.
+        db.Index('ix_timeline_entries_message_id', 'message_id'),
+    )
+
+
+class Recommendation(db.Model):
+    """An account suggested to a user to follow, precomputed in batch.
+
+    Rows are rewritten by `flask compute-recommendations` (see
+    recommendations.py); the suggestions page reads one user's rows in
+    rank order, a single range scan on the primary key.
+    """
+
+    __tablename__ = 'recommendations'
+
+    user_id = db.Column(
+        db.Integer,
+        db.ForeignKey('users.id', ondelete='cascade'),
+        primary_key=True,
+    )
+
+    rank = db.Column(
+        db.Integer,
+        primary_key=True,
+    )
+
+    suggested_id = db.Column(
+        db.Integer,
+        db.ForeignKey('users.id', ondelete='cascade'),
+        nullable=False,
+    )
+
+    score = db.Column(
+        db.Float,
+        nullable=False,
+    )
+
+    suggested = db.relationship('User', foreign_keys=[suggested_id])
+
 
 def connect_db(app):
     """Connect this database to provided Flask app.
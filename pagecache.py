@@ -0,0 +1,214 @@
+"""Whole-page cache for anonymous visitors.
+
+Public pages -- the anonymous home page, profiles and single messages --
+are the same for every visitor who isn't logged in. Views marked with
+`@cache.cached` have their anonymous GET responses stored for a few seconds
+(PAGE_CACHE_TTL) and served from a `before_request` hook, before the
+logged-in user is loaded, any query runs or any template renders.
+
+- Bodies are kept gzipped. Clients that accept gzip get the stored bytes
+  as they are; others get them decompressed.
+- When an entry is missing or stale, one request recomputes it while
+  concurrent requests for the same page wait for it (or are served the
+  stale copy), so an expiring popular page doesn't send a crowd of
+  identical requests to the database at once.
+- Views tag what a page shows with `tag('user', id)` and the like, and
+  views that change those things call `invalidate()` once they commit, so
+  a new message or profile edit shows at once. Changes not invalidated
+  (counts of follows and likes) show within the TTL.
+
+Responses that set a cookie, and requests with a session beyond what an
+anonymous visitor has (e.g. pending flash messages), are never cached.
+The cache is per process: another process's invalidations reach it only
+through the TTL.
+"""
+
+from collections import OrderedDict, namedtuple
+import gzip
+from threading import Event, Lock
+from time import monotonic
+
+from flask import current_app, g, request, session
+
+DEFAULT_TTL = 5
+DEFAULT_MAX_BYTES = 32 * 1024 * 1024
+
+# Longest a request waits for another to compute the page it wants.
+WAIT_TIMEOUT = 5
+
+# Headers that describe one response, not the page.
+UNCACHED_HEADERS = {'Content-Length', 'Server-Timing', 'Set-Cookie'}
+
+Entry = namedtuple('Entry', 'body status headers tags expires')
+
+
+class PageCache:
+    """Gzipped anonymous responses, keyed by path and query string."""
+
+    def __init__(self, ttl=DEFAULT_TTL, max_bytes=DEFAULT_MAX_BYTES):
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.user_key = None
+        self._entries = OrderedDict()
+        self._tagged = {}
+        self._computing = {}
+        self._bytes = 0
+        # Counts invalidations, so a page computed while one happened
+        # isn't stored.
+        self._generation = 0
+        self._lock = Lock()
+
+    def init_app(self, app, user_key):
+        """Serve and store cached pages for `app`; `user_key` is the
+        session key that marks a logged-in visitor."""
+
+        self.user_key = user_key
+        app.config.setdefault('PAGE_CACHE_ENABLED', True)
+        self.ttl = app.config.setdefault('PAGE_CACHE_TTL', self.ttl)
+        self.max_bytes = app.config.setdefault('PAGE_CACHE_MAX_BYTES',
+                                               self.max_bytes)
+
+        app.before_request(self.serve)
+        app.after_request(self.store)
+        app.teardown_request(self.finish)
+
+    def cached(self, view):
+        """Mark a view as cacheable for anonymous visitors."""
+
+        view.page_cacheable = True
+        return view
+
+    def cacheable(self):
+        """Could the current request be answered from the cache?"""
+
+        if (request.method != 'GET'
+                or not current_app.config.get('PAGE_CACHE_ENABLED', True)):
+            return False
+
+        view = current_app.view_functions.get(request.endpoint)
+        if not getattr(view, 'page_cacheable', False):
+            return False
+
+        # Logged in, or with flash messages waiting to be shown.
+        return self.user_key not in session and '_flashes' not in session
+
+    def serve(self):
+        """before_request: answer from the cache, or become (or wait for)
+        the request that computes this page."""
+
+        if not self.cacheable():
+            return None
+
+        key = request.full_path
+        while True:
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None:
+                    self._entries.move_to_end(key)
+                fresh = entry is not None and entry.expires > monotonic()
+
+                computing = self._computing.get(key)
+                if not fresh and computing is None:
+                    self._computing[key] = Event()
+                    g.page_cache_key = key
+                    g.page_cache_tags = set()
+                    g.page_cache_generation = self._generation
+                    return None
+
+            if entry is not None:
+                return self.respond(entry)
+            if not computing.wait(WAIT_TIMEOUT):
+                return None
+
+    def respond(self, entry):
+        """A response for the current request from a cached entry."""
+
+        response = current_app.response_class(status=entry.status)
+        response.headers.extend(entry.headers)
+        response.vary.add('Accept-Encoding')
+
+        if 'gzip' in request.accept_encodings:
+            response.set_data(entry.body)
+            response.content_encoding = 'gzip'
+        else:
+            response.set_data(gzip.decompress(entry.body))
+
+        return response.make_conditional(request)
+
+    def store(self, response):
+        """after_request: keep the page this request computed."""
+
+        key = g.get('page_cache_key')
+        if key is None:
+            return response
+
+        if (response.status_code != 200 or response.direct_passthrough
+                or 'Set-Cookie' in response.headers):
+            return response
+
+        headers = [(name, value) for name, value in response.headers
+                   if name not in UNCACHED_HEADERS]
+        entry = Entry(gzip.compress(response.get_data()),
+                      response.status_code, headers,
+                      frozenset(g.page_cache_tags), monotonic() + self.ttl)
+
+        with self._lock:
+            if g.page_cache_generation != self._generation:
+                return response
+            self._remove(key)
+            self._entries[key] = entry
+            self._bytes += len(entry.body)
+            for tag in entry.tags:
+                self._tagged.setdefault(tag, set()).add(key)
+            while self._bytes > self.max_bytes and self._entries:
+                self._remove(next(iter(self._entries)))
+
+        return response
+
+    def finish(self, exc=None):
+        """teardown_request: let requests waiting on this one go ahead."""
+
+        key = g.pop('page_cache_key', None)
+        if key is None:
+            return
+
+        with self._lock:
+            self._computing.pop(key).set()
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        self._bytes -= len(entry.body)
+        for tag in entry.tags:
+            keys = self._tagged.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tagged[tag]
+
+    def invalidate(self, kind, id):
+        """Drop every cached page that shows `kind` `id`."""
+
+        with self._lock:
+            self._generation += 1
+            for key in list(self._tagged.get(f'{kind}:{id}', ())):
+                self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._tagged.clear()
+            self._bytes = 0
+
+
+def tag(kind, id):
+    """Note that the page being computed shows `kind` `id`, e.g.
+    tag('user', 3), so invalidating that tag drops it."""
+
+    tags = g.get('page_cache_tags')
+    if tags is not None:
+        tags.add(f'{kind}:{id}')
+
+
+cache = PageCache()
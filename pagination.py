@@ -0,0 +1,76 @@
+"""Keyset (cursor) pagination for message and follow lists.
+
+Pages are ordered newest first on (timestamp, id) -- a message's, or a
+follow's and the listed user's. The cursor for the next page is the key of
+the last item shown, and the next page is fetched with
+`WHERE (timestamp, id) < cursor`, so every page costs one index range scan
+no matter how far back the reader has scrolled.
+"""
+
+from datetime import datetime
+
+from flask import abort
+from sqlalchemy import tuple_
+
+PER_PAGE = 100
+
+
+def encode_cursor(timestamp, id):
+    """Turn a (timestamp, id) key into a string for a `?before=` param."""
+
+    return f"{timestamp.isoformat()}_{id}"
+
+
+def decode_cursor(cursor):
+    """Parse a `?before=` param into a (timestamp, id) key.
+
+    Returns None if there is no cursor; aborts with 400 if it is malformed.
+    """
+
+    if not cursor:
+        return None
+
+    try:
+        timestamp, id = cursor.rsplit('_', 1)
+        return datetime.fromisoformat(timestamp), int(id)
+    except ValueError:
+        abort(400)
+
+
+def older_than(query, timestamp_col, id_col, key):
+    """Restrict `query` to rows older than the (timestamp, id) `key`."""
+
+    if key is None:
+        return query
+
+    return query.filter(tuple_(timestamp_col, id_col) < tuple_(*key))
+
+
+def message_key(msg):
+    return msg.timestamp, msg.id
+
+
+class Page:
+    """One page of messages, plus the cursor for the page after it."""
+
+    def __init__(self, items, per_page=PER_PAGE, key=message_key):
+        """Build from up to `per_page` + 1 items fetched newest first.
+
+        The extra item only signals that an older page exists. `key` gives
+        an item's (timestamp, id).
+        """
+
+        self.items = items[:per_page]
+        self.next_cursor = None
+
+        if len(items) > per_page:
+            self.next_cursor = encode_cursor(*key(self.items[-1]))
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def to_dict(self):
+        return {
+            'messages': [msg.to_dict() for msg in self.items],
+            'next': self.next_cursor,
+        }
@@ -0,0 +1,108 @@
+"""Password hashing.
+
+Hashes use bcrypt with a configurable cost (BCRYPT_LOG_ROUNDS; each extra
+round doubles the work). Hashing and checking are CPU-bound for tens to
+hundreds of milliseconds, so they run in a small process pool
+(PASSWORD_HASH_WORKERS processes) instead of on request threads, and at
+most PASSWORD_HASH_QUEUE of them may wait for the pool at once: beyond that
+`hash()` and `check()` raise `HashingBusy` instead of queueing more work,
+so a login storm can't tie up every request thread.
+
+When the cost changes, existing hashes keep working; `needs_rehash()`
+tells the login view to store a new hash at the current cost.
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+import os
+from threading import BoundedSemaphore, Lock
+
+import bcrypt
+
+DEFAULT_ROUNDS = 12
+DEFAULT_QUEUE = 64
+
+
+class HashingBusy(Exception):
+    """Too many password hashes are already waiting to run."""
+
+
+def _hash(password, rounds):
+    return bcrypt.hashpw(password.encode('utf-8'),
+                         bcrypt.gensalt(rounds)).decode('utf-8')
+
+
+def _check(hashed, password):
+    return bcrypt.checkpw(password.encode('utf-8'), hashed.encode('utf-8'))
+
+
+def rounds_of(hashed):
+    """The cost a bcrypt hash was made with (`$2b$12$...` is 12)."""
+
+    return int(hashed.split('$')[2])
+
+
+class PasswordHasher:
+    """Hashes and checks passwords in a bounded pool of processes."""
+
+    def __init__(self, rounds=DEFAULT_ROUNDS, workers=None,
+                 queue=DEFAULT_QUEUE):
+        self.rounds = rounds
+        self.workers = os.cpu_count() if workers is None else workers
+        self.queue = queue
+        self._slots = BoundedSemaphore(queue)
+        self._pool = None
+        self._lock = Lock()
+
+    def init_app(self, app):
+        self.rounds = app.config.get('BCRYPT_LOG_ROUNDS', self.rounds)
+        self.workers = app.config.get('PASSWORD_HASH_WORKERS', self.workers)
+        self.queue = app.config.get('PASSWORD_HASH_QUEUE', self.queue)
+        self._slots = BoundedSemaphore(self.queue)
+
+    def pool(self):
+        """The process pool, started on first use."""
+
+        with self._lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(self.workers)
+            return self._pool
+
+    def shutdown(self):
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown()
+                self._pool = None
+
+    def run(self, fn, *args):
+        """Run `fn(*args)` in the pool and wait for its result.
+
+        With no workers configured, run it here instead.
+        """
+
+        if not self.workers:
+            return fn(*args)
+
+        if not self._slots.acquire(blocking=False):
+            raise HashingBusy()
+        try:
+            return self.pool().submit(fn, *args).result()
+        finally:
+            self._slots.release()
+
+    def hash(self, password):
+        """Hash `password` at the current cost."""
+
+        return self.run(_hash, password, self.rounds)
+
+    def check(self, hashed, password):
+        """Does `password` match `hashed`?"""
+
+        return self.run(_check, hashed, password)
+
+    def needs_rehash(self, hashed):
+        """Was `hashed` made with a different cost than the current one?"""
+
+        return rounds_of(hashed) != self.rounds
+
+
+hasher = PasswordHasher()
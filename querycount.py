@@ -0,0 +1,32 @@
+"""Count the SQL statements run by a block of code.
+
+Used by the tests to pin how many queries a view issues, so an N+1 query
+(e.g. a template lazily loading each message's author) fails a test:
+
+    with count_queries() as queries:
+        client.get("/")
+    self.assertEqual(len(queries), 4)
+"""
+
+from contextlib import contextmanager
+
+from sqlalchemy import event
+
+from models import db
+
+
+@contextmanager
+def count_queries(engine=None):
+    """Collect the statements executed on `engine` inside the block."""
+
+    engine = engine or db.engine
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine, 'before_cursor_execute', record)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, 'before_cursor_execute', record)
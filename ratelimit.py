@@ -0,0 +1,199 @@
+"""Rate limiting with token buckets.
+
+Each limit is a bucket per key (client IP, username tried, logged-in
+user): it holds up to `count` tokens, refills at `count` tokens every
+`per` seconds, and every request takes one. A request that finds its bucket
+empty is answered 429 Too Many Requests with a Retry-After header, before
+the view runs -- in particular before /login does any bcrypt work.
+
+Buckets live in a store. `MemoryStore` keeps them in this process and
+forgets buckets once they have refilled, so idle clients cost nothing.
+With several app processes, each would enforce its own limits; use
+`SharedStore` over a backend every process can reach (e.g. Redis) instead.
+`LocalBackend` is an in-process stand-in for such a backend.
+"""
+
+from collections import OrderedDict, namedtuple
+from functools import wraps
+from threading import Lock
+from time import monotonic, time
+
+from flask import current_app, g, request
+from werkzeug.exceptions import TooManyRequests
+
+
+class Limit(namedtuple('Limit', 'count per')):
+    """`count` requests every `per` seconds, all usable at once."""
+
+    @property
+    def rate(self):
+        return self.count / self.per
+
+
+LOGIN_PER_IP = Limit(20, 60)
+LOGIN_PER_USERNAME = Limit(5, 60)
+SIGNUP_PER_IP = Limit(5, 60)
+CHANGES_PER_USER = Limit(60, 60)
+
+
+def take(state, limit, now):
+    """Take a token from a bucket.
+
+    `state` is the bucket's (tokens, updated) or None for a full bucket.
+    Returns (new_state, wait): `wait` is 0 if a token was taken, otherwise
+    the seconds until one will be available.
+    """
+
+    tokens, updated = state or (limit.count, now)
+    tokens = min(limit.count, tokens + (now - updated) * limit.rate)
+
+    if tokens >= 1:
+        return (tokens - 1, now), 0
+    return (tokens, now), (1 - tokens) / limit.rate
+
+
+def refill_time(state, limit):
+    """Seconds until a bucket is full again and can be forgotten."""
+
+    tokens, updated = state
+    return (limit.count - tokens) / limit.rate
+
+
+class MemoryStore:
+    """Buckets held in this process, dropped once they refill."""
+
+    def __init__(self):
+        # key -> (state, expires), least recently used first.
+        self._buckets = OrderedDict()
+        self._lock = Lock()
+
+    def take(self, key, limit):
+        now = monotonic()
+        with self._lock:
+            self._expire(now)
+            entry = self._buckets.pop(key, None)
+            state, wait = take(entry and entry[0], limit, now)
+            self._buckets[key] = (state, now + refill_time(state, limit))
+        return wait
+
+    def _expire(self, now):
+        # Buckets expire in roughly the order they were last used; stop at
+        # the first live one rather than scanning them all.
+        while self._buckets:
+            key, (state, expires) = next(iter(self._buckets.items()))
+            if expires > now:
+                return
+            del self._buckets[key]
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+
+
+class LocalBackend:
+    """In-process stand-in for a shared key-value backend.
+
+    A real backend must implement `update()` atomically across processes,
+    e.g. as a Lua script in Redis.
+    """
+
+    def __init__(self):
+        self._values = {}
+        self._lock = Lock()
+
+    def update(self, key, fn, ttl):
+        """Atomically replace the value at `key` (None if missing or
+        expired) with the first item of `fn(value)`, expiring after
+        `ttl(new_value)` seconds; return the second item."""
+
+        now = monotonic()
+        with self._lock:
+            value, expires = self._values.get(key, (None, now))
+            if expires < now:
+                value = None
+            value, result = fn(value)
+            self._values[key] = (value, now + ttl(value))
+        return result
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+
+class SharedStore:
+    """Buckets held in a backend shared by every app process."""
+
+    def __init__(self, backend):
+        self.backend = backend
+
+    def take(self, key, limit):
+        # Processes on different machines share wall-clock time, not
+        # monotonic time.
+        now = time()
+        return self.backend.update(
+            key, lambda state: take(state, limit, now),
+            lambda state: refill_time(state, limit))
+
+    def clear(self):
+        self.backend.clear()
+
+
+class RateLimiter:
+    """Checks requests against limits kept in a store."""
+
+    def __init__(self, store=None):
+        self.store = store or MemoryStore()
+
+    def init_app(self, app):
+        app.config.setdefault('RATELIMIT_ENABLED', True)
+
+    def check(self, name, limit, key):
+        """Take a token from the `name` bucket for `key`, or raise 429."""
+
+        if not current_app.config.get('RATELIMIT_ENABLED', True):
+            return
+
+        wait = self.store.take(f'{name}:{key}', limit)
+        if wait:
+            raise TooManyRequests(retry_after=int(wait) + 1)
+
+    def limit(self, name, limit, key):
+        """Decorate a view so requests that change data (any method but
+        GET and HEAD) are limited per `key()`."""
+
+        def decorator(view):
+            @wraps(view)
+            def limited(*args, **kwargs):
+                if request.method not in ('GET', 'HEAD'):
+                    self.check(name, limit, key())
+                return view(*args, **kwargs)
+            return limited
+        return decorator
+
+    def reset(self):
+        self.store.clear()
+
+
+def by_ip():
+    return request.remote_addr
+
+
+def by_username():
+    """The username being logged in as, so guesses from many IPs at one
+    account are limited too."""
+
+    return request.form.get('username', '').lower()
+
+
+def by_user():
+    """The logged-in user, or the IP for anonymous requests."""
+
+    if g.get('user'):
+        return f'user:{g.user.id}'
+    return f'ip:{request.remote_addr}'
+
+
+limiter = RateLimiter()
+
+# Applied to every view that changes data.
+limit_changes = limiter.limit('changes', CHANGES_PER_USER, by_user)
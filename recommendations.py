@@ -0,0 +1,150 @@
+"""Who-to-follow suggestions, precomputed in batch.
+
+`compute()` scores, for every user, the accounts followed by the people
+they follow (friends of friends):
+
+    score = mutual * (1 + ACTIVITY_WEIGHT * log(1 + recent))
+
+where `mutual` is how many of the user's follows follow the candidate, and
+`recent` how many messages the candidate posted in the last RECENT_DAYS
+days. The user and the accounts they already follow are left out. Users
+with fewer than `limit` candidates -- new accounts, mostly -- are topped
+up with popular, recently active accounts, scored 0.
+
+The follows table is scanned once into the CSR arrays of followgraph.py,
+and each user's friends of friends are tallied by a Counter fed straight
+from their follows' runs, so the inner loop runs in C. The best `limit`
+per user replace the recommendations table in the caller's transaction,
+and the suggestions page reads one user's rows by primary key.
+
+Run it periodically, e.g. hourly from cron:
+
+    flask compute-recommendations
+"""
+
+from collections import Counter
+from datetime import datetime, timedelta
+from heapq import nlargest
+from itertools import chain
+from math import log1p
+
+from sqlalchemy import func
+
+from followgraph import contains, scan
+from models import db, Follows, Message, Recommendation, User
+
+DEFAULT_LIMIT = 20
+
+# Messages posted in this many days count as recent activity, weighted
+# as in the formula above.
+RECENT_DAYS = 30
+ACTIVITY_WEIGHT = 0.5
+
+# How many of the most-followed accounts are considered for topping up
+# users with few friends of friends.
+POPULAR_POOL = 200
+
+# Rows inserted per statement.
+BATCH_SIZE = 10000
+
+
+def score(mutual, recent):
+    return mutual * (1 + ACTIVITY_WEIGHT * log1p(recent))
+
+
+def recent_activity(days=RECENT_DAYS):
+    """{user_id: messages posted in the last `days` days}."""
+
+    since = datetime.utcnow() - timedelta(days=days)
+    return dict(db.session.query(Message.user_id, func.count())
+                .filter(Message.timestamp >= since)
+                .group_by(Message.user_id))
+
+
+def popular(activity, size=POPULAR_POOL):
+    """Ids of the `size` most-followed accounts, best scored first, with
+    followers standing in for mutual follows."""
+
+    users = (db.session.query(User.id, User.followers_count)
+             .filter(User.followers_count > 0)
+             .order_by(User.followers_count.desc(), User.id)
+             .limit(size))
+    return [user.id for user in
+            sorted(users, key=lambda user: (
+                -score(user.followers_count, activity.get(user.id, 0)),
+                user.id))]
+
+
+def suggest(user_id, following, activity, fallback, limit=DEFAULT_LIMIT):
+    """[(score, suggested_id)] for one user, best first.
+
+    `following` is the following direction of the graph, `activity` as
+    from recent_activity() and `fallback` as from popular().
+    """
+
+    run = following[user_id]
+    mutual = Counter(chain.from_iterable(following[id] for id in run))
+    mutual.pop(user_id, None)
+
+    best = nlargest(limit,
+                    ((score(count, activity.get(id, 0)), id)
+                     for id, count in mutual.items()
+                     if not contains(run, id)),
+                    key=lambda suggestion: (suggestion[0], -suggestion[1]))
+
+    chosen = {id for _, id in best}
+    for id in fallback:
+        if len(best) >= limit:
+            break
+        if id != user_id and id not in chosen and not contains(run, id):
+            best.append((0.0, id))
+
+    return best
+
+
+def compute(limit=DEFAULT_LIMIT):
+    """Replace every user's suggestions; return how many were written.
+
+    Runs in the caller's transaction, so the page keeps showing the old
+    suggestions until it commits.
+    """
+
+    following = scan(Follows.user_following_id,
+                     Follows.user_being_followed_id)
+    activity = recent_activity()
+    fallback = popular(activity)
+    user_ids = [id for (id,) in db.session.query(User.id).order_by(User.id)]
+
+    Recommendation.query.delete(synchronize_session=False)
+
+    written = 0
+    rows = []
+
+    def flush():
+        nonlocal written
+        if rows:
+            db.session.execute(Recommendation.__table__.insert(), rows)
+            written += len(rows)
+            rows.clear()
+
+    for user_id in user_ids:
+        suggestions = suggest(user_id, following, activity, fallback, limit)
+        rows.extend({'user_id': user_id, 'rank': rank,
+                     'suggested_id': suggested_id, 'score': value}
+                    for rank, (value, suggested_id)
+                    in enumerate(suggestions, 1))
+        if len(rows) >= BATCH_SIZE:
+            flush()
+    flush()
+
+    return written
+
+
+def suggestions_for(user_id):
+    """The users suggested to `user_id`, best first."""
+
+    return (User.query
+            .join(Recommendation, Recommendation.suggested_id == User.id)
+            .filter(Recommendation.user_id == user_id)
+            .order_by(Recommendation.rank)
+            .all())
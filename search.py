@@ -0,0 +1,382 @@
+"""Search over users and messages.
+
+On PostgreSQL, searches run in the database: users against pg_trgm GIN
+indexes on username, bio and location (so `ILIKE '%q%'` no longer scans the
+whole users table), and messages against a GIN full-text index on
+`to_tsvector('english', text)`, which Postgres keeps current as messages are
+inserted and deleted.
+
+Other databases (SQLite in development and tests) use in-process inverted
+indexes instead -- `NgramIndex` for users and `MessageIndex` for messages --
+built from the database on first use and kept current by the views that
+change users and messages. They are per process, so they only suit
+single-process setups.
+
+User results are ranked the same either way: usernames starting with the
+query first, then usernames containing it, then matches in location and bio.
+Message results contain every word of the query, best match first.
+"""
+
+from collections import Counter
+from math import log, sqrt
+import re
+from threading import Lock
+
+from sqlalchemy import DDL, case, event, func, or_, tuple_
+
+from models import db, Message, User
+
+PER_PAGE = 30
+
+# Don't page deeper than this into ranked results.
+MAX_PAGES = 20
+
+TRIGRAM_COLUMNS = ('username', 'bio', 'location')
+
+event.listen(
+    User.__table__, 'before_create',
+    DDL('CREATE EXTENSION IF NOT EXISTS pg_trgm').execute_if(
+        dialect='postgresql'))
+
+for column in TRIGRAM_COLUMNS:
+    event.listen(
+        User.__table__, 'after_create',
+        DDL(f'CREATE INDEX IF NOT EXISTS ix_users_{column}_trgm '
+            f'ON users USING gin ({column} gin_trgm_ops)').execute_if(
+            dialect='postgresql'))
+
+event.listen(
+    Message.__table__, 'after_create',
+    DDL("CREATE INDEX IF NOT EXISTS ix_messages_text_fts "
+        "ON messages USING gin (to_tsvector('english', text))").execute_if(
+        dialect='postgresql'))
+
+
+def trigrams(text):
+    """The set of three-character substrings of lowercased `text`."""
+
+    text = (text or '').lower()
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+WORD = re.compile(r"[a-z0-9']+")
+
+
+def words(text):
+    """Lowercased words of `text`, the tokens of the message index."""
+
+    return WORD.findall((text or '').lower())
+
+
+def rank(query, username, location, bio):
+    """Sort key for a user matching `query`; lower ranks first, and None
+    means no match.
+
+    Like `ILIKE '%query%'`, a match is `query` appearing anywhere in one
+    of the fields, ignoring case.
+    """
+
+    query = query.lower()
+    username = username.lower()
+
+    if username.startswith(query):
+        return 0
+    if query in username:
+        return 1
+    if query in (location or '').lower():
+        return 2
+    if query in (bio or '').lower():
+        return 3
+    return None
+
+
+class InvertedIndex:
+    """Maps tokens to the ids of the documents containing them."""
+
+    def __init__(self):
+        self.postings = {}
+        self.tokens = {}
+        self.lock = Lock()
+
+    def add(self, doc_id, tokens):
+        self.remove(doc_id)
+        self.tokens[doc_id] = tokens
+        for token in tokens:
+            self.postings.setdefault(token, set()).add(doc_id)
+
+    def remove(self, doc_id):
+        for token in self.tokens.pop(doc_id, ()):
+            ids = self.postings[token]
+            ids.discard(doc_id)
+            if not ids:
+                del self.postings[token]
+
+    def containing_all(self, tokens):
+        """Ids of the documents that contain every one of `tokens`."""
+
+        postings = sorted((self.postings.get(token, set()) for token in tokens),
+                          key=len)
+        if not postings:
+            return set(self.tokens)
+        return postings[0].intersection(*postings[1:])
+
+
+class NgramIndex(InvertedIndex):
+    """Trigram index over user search fields."""
+
+    def __init__(self):
+        super().__init__()
+        self.fields = {}
+        self.loaded = False
+
+    def add_user(self, id, username, bio, location):
+        self.fields[id] = (username, location, bio)
+        self.add(id, trigrams(username) | trigrams(bio) | trigrams(location))
+
+    def remove_user(self, id):
+        self.fields.pop(id, None)
+        self.remove(id)
+
+    def clear(self):
+        """Empty the index; it reloads from the database on next use."""
+
+        with self.lock:
+            self.postings.clear()
+            self.tokens.clear()
+            self.fields.clear()
+            self.loaded = False
+
+    def load(self):
+        """Index every user, the first time the index is used."""
+
+        if self.loaded:
+            return
+
+        rows = db.session.query(User.id, User.username, User.bio,
+                                User.location)
+        for row in rows:
+            self.add_user(*row)
+        self.loaded = True
+
+    def search(self, query):
+        """Ids of users matching `query`, best first.
+
+        Any user containing `query` contains all of its trigrams, so the
+        index narrows the candidates and `rank()` confirms each one.
+        Queries under three characters have no trigrams and check everyone.
+        """
+
+        with self.lock:
+            self.load()
+            candidates = self.containing_all(trigrams(query))
+            ranked = [(rank(query, *self.fields[id]), id) for id in candidates]
+
+        return [id for score, id in
+                sorted(match for match in ranked if match[0] is not None)]
+
+
+class MessageIndex(InvertedIndex):
+    """Word index over message text, ranked by TF-IDF."""
+
+    def __init__(self):
+        super().__init__()
+        self.loaded = False
+
+    def add_message(self, id, text):
+        self.add(id, Counter(words(text)))
+
+    def remove_message(self, id):
+        self.remove(id)
+
+    def clear(self):
+        """Empty the index; it reloads from the database on next use."""
+
+        with self.lock:
+            self.postings.clear()
+            self.tokens.clear()
+            self.loaded = False
+
+    def load(self):
+        """Index every message, the first time the index is used."""
+
+        if self.loaded:
+            return
+
+        for id, text in db.session.query(Message.id, Message.text):
+            self.add_message(id, text)
+        self.loaded = True
+
+    def search(self, query):
+        """(score, id) of messages containing every word of `query`, best
+        first."""
+
+        terms = set(words(query))
+        if not terms:
+            return []
+
+        with self.lock:
+            self.load()
+            total = len(self.tokens)
+            idf = {term: log(1 + total / len(self.postings.get(term, ())))
+                   for term in terms if term in self.postings}
+            if len(idf) < len(terms):
+                return []
+
+            scored = []
+            for id in self.containing_all(terms):
+                counts = self.tokens[id]
+                length = sqrt(sum(counts.values()))
+                score = sum(counts[term] * idf[term] for term in terms)
+                scored.append((score / length, id))
+
+        scored.sort(reverse=True)
+        return scored
+
+
+index = NgramIndex()
+messages = MessageIndex()
+
+
+def uses_database():
+    return db.engine.dialect.name == 'postgresql'
+
+
+def refresh_user(user):
+    """Re-index a user after their searchable fields change."""
+
+    if index.loaded:
+        with index.lock:
+            index.add_user(user.id, user.username, user.bio, user.location)
+
+
+def forget_user(user_id):
+    """Drop a deleted user from the index."""
+
+    if index.loaded:
+        with index.lock:
+            index.remove_user(user_id)
+
+
+def index_message(msg):
+    """Add a new message to the index."""
+
+    if messages.loaded:
+        with messages.lock:
+            messages.add_message(msg.id, msg.text)
+
+
+def forget_messages(message_ids):
+    """Drop deleted messages from the index."""
+
+    if messages.loaded:
+        with messages.lock:
+            for id in message_ids:
+                messages.remove_message(id)
+
+
+def escape_like(text):
+    return (text.replace('\\', '\\\\')
+            .replace('%', '\\%')
+            .replace('_', '\\_'))
+
+
+def search_users(query, page=1):
+    """Return (users, has_more) for one page of users matching `query`."""
+
+    page = min(max(page, 1), MAX_PAGES)
+    offset = (page - 1) * PER_PAGE
+
+    if uses_database():
+        pattern = f"%{escape_like(query)}%"
+        users = (User
+                 .query
+                 .filter(or_(*[getattr(User, column).ilike(pattern,
+                                                           escape='\\')
+                               for column in TRIGRAM_COLUMNS]))
+                 .order_by(case((User.username.ilike(f"{escape_like(query)}%",
+                                                     escape='\\'), 0),
+                                (User.username.ilike(pattern, escape='\\'), 1),
+                                (User.location.ilike(pattern, escape='\\'), 2),
+                                else_=3),
+                           func.similarity(User.username, query).desc(),
+                           User.id)
+                 .offset(offset)
+                 .limit(PER_PAGE + 1)
+                 .all())
+    else:
+        ids = index.search(query)[offset:offset + PER_PAGE + 1]
+        by_id = {user.id: user
+                 for user in User.query.filter(User.id.in_(ids))}
+        users = [by_id[id] for id in ids if id in by_id]
+
+    has_more = len(users) > PER_PAGE and page < MAX_PAGES
+    return users[:PER_PAGE], has_more
+
+
+def list_users(after=None):
+    """Return (users, next_after) for one page of all users, by id."""
+
+    users = User.query
+    if after is not None:
+        users = users.filter(User.id > after)
+    users = users.order_by(User.id).limit(PER_PAGE + 1).all()
+
+    next_after = users[PER_PAGE - 1].id if len(users) > PER_PAGE else None
+    return users[:PER_PAGE], next_after
+
+
+def encode_cursor(score, id):
+    """Cursor for the message search page after a (score, id) result."""
+
+    return f"{score!r}_{id}"
+
+
+def decode_cursor(cursor):
+    """Parse a message search cursor; None if missing or malformed."""
+
+    try:
+        score, id = cursor.rsplit('_', 1)
+        return float(score), int(id)
+    except (AttributeError, ValueError):
+        return None
+
+
+def search_messages(query, before=None, per_page=PER_PAGE):
+    """Return (messages, next_cursor) for one page of messages matching
+    `query`, best match first.
+
+    Paging is keyset-based on (score, id): `before` is the cursor of the
+    last result on the previous page.
+    """
+
+    if uses_database():
+        document = func.to_tsvector('english', Message.text)
+        tsquery = func.plainto_tsquery('english', query)
+        score = func.ts_rank(document, tsquery)
+
+        results = (db.session.query(Message, score)
+                   .options(Message.with_author())
+                   .filter(document.op('@@')(tsquery)))
+        if before is not None:
+            results = results.filter(tuple_(score, Message.id) < tuple_(*before))
+        results = [(score, msg) for msg, score in
+                   results.order_by(score.desc(), Message.id.desc())
+                   .limit(per_page + 1)]
+    else:
+        ranked = messages.search(query)
+        if before is not None:
+            ranked = [match for match in ranked if match < before]
+        ranked = ranked[:per_page + 1]
+
+        by_id = {msg.id: msg for msg in
+                 Message.query
+                 .options(Message.with_author())
+                 .filter(Message.id.in_([id for score, id in ranked]))}
+        results = [(score, by_id[id]) for score, id in ranked if id in by_id]
+
+    next_cursor = None
+    if len(results) > per_page:
+        score, msg = results[per_page - 1]
+        next_cursor = encode_cursor(score, msg.id)
+
+    return [msg for score, msg in results[:per_page]], next_cursor
@@ -1,20 +1,259 @@
-"""Seed database with sample data from CSV Files."""
+"""Seed database with sample data from CSV Files.
 
-from csv import DictReader
-from app import db
+    python seed.py                       # load generator/*.csv
+    python seed.py --data-dir big/       # load CSVs from another directory
+    python seed.py --resume              # carry on after an interrupted load
+
+The CSVs are streamed in chunks, so files of any size load in constant
+memory. On PostgreSQL each chunk goes in with `COPY ... FROM STDIN`; other
+databases (SQLite in development) use batched multi-row inserts.
+
+Secondary indexes and foreign keys are dropped before loading and rebuilt
+once at the end, which is far cheaper than maintaining them row by row. Their
+definitions are saved in a checkpoint file, along with how far the load got,
+so `--resume` can pick up after a crash without starting over. Users and
+messages get their ids from their row number in the CSV (the other files
+refer to them that way), so a resumed load assigns the same ids.
+
+Finally the id sequences are moved past the loaded rows, and the counters
+and home timelines are computed from the loaded data.
+"""
+
+import argparse
+import csv
+from datetime import datetime
+from io import StringIO
+from itertools import islice
+import json
+import os
+import sys
+from time import perf_counter
+
+from sqlalchemy import DateTime, func, text
+
+from app import app, db
 from models import User, Message, Follows
+import counters
+import migrate
+import timeline
+
+# (CSV file, model, whether rows get their id from their CSV row number),
+# in load order.
+SOURCES = [
+    ('users.csv', User, True),
+    ('messages.csv', Message, True),
+    ('follows.csv', Follows, False),
+]
+
+CHUNK_SIZE = 10000
+
+CHECKPOINT = '.seed-checkpoint.json'
+
+
+def chunks(rows, size):
+    """Split an iterable into lists of at most `size` items."""
+
+    rows = iter(rows)
+    while True:
+        chunk = list(islice(rows, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def deferred_schema(conn):
+    """Return (indexes, foreign_keys) that can be dropped during the load.
+
+    Both are lists of (table, name, definition). Primary keys and unique
+    constraints stay, so bad data still fails the load.
+    """
+
+    if conn.dialect.name == 'postgresql':
+        indexes = conn.execute(text(
+            "SELECT tablename, indexname, indexdef FROM pg_indexes "
+            "WHERE schemaname = current_schema() AND indexname NOT IN "
+            "(SELECT conname FROM pg_constraint)")).fetchall()
+        foreign_keys = conn.execute(text(
+            "SELECT conrelid::regclass::text, conname, "
+            "pg_get_constraintdef(oid) FROM pg_constraint "
+            "WHERE contype = 'f' "
+            "AND connamespace = current_schema()::regnamespace")).fetchall()
+    else:
+        indexes = conn.execute(text(
+            "SELECT tbl_name, name, sql FROM sqlite_master "
+            "WHERE type = 'index' AND sql IS NOT NULL")).fetchall()
+        foreign_keys = []
+
+    return [list(row) for row in indexes], [list(row) for row in foreign_keys]
+
+
+def drop_deferred(conn, indexes, foreign_keys):
+    for table, name, definition in foreign_keys:
+        conn.execute(text(f'ALTER TABLE {table} DROP CONSTRAINT {name}'))
+    for table, name, definition in indexes:
+        conn.execute(text(f'DROP INDEX {name}'))
+
+
+def restore_deferred(conn, indexes, foreign_keys):
+    for table, name, definition in indexes:
+        log(f'creating index {name}')
+        conn.execute(text(definition))
+    for table, name, definition in foreign_keys:
+        log(f'adding constraint {name}')
+        conn.execute(text(
+            f'ALTER TABLE {table} ADD CONSTRAINT {name} {definition}'))
+
+
+def loaded_rows(conn, model):
+    """Rows of `model` already loaded; each chunk commits whole, so this is
+    where a resumed load picks up."""
+
+    return conn.execute(db.select(func.count()).select_from(model.__table__)
+                        ).scalar()
+
+
+def copy_chunk(columns, table, rows):
+    """Load rows into `table` with PostgreSQL's COPY."""
+
+    buffer = StringIO()
+    csv.writer(buffer).writerows(rows)
+    buffer.seek(0)
+
+    conn = db.engine.raw_connection()
+    try:
+        conn.cursor().copy_expert(
+            f"COPY {table.name} ({', '.join(columns)}) "
+            f"FROM STDIN WITH (FORMAT csv)", buffer)
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def insert_chunk(columns, table, rows):
+    """Load rows into `table` with one multi-row INSERT."""
+
+    timestamps = [i for i, column in enumerate(columns)
+                  if isinstance(table.c[column].type, DateTime)]
+
+    values = []
+    for row in rows:
+        row = list(row)
+        for i in timestamps:
+            row[i] = datetime.fromisoformat(row[i])
+        values.append(dict(zip(columns, row)))
+
+    with db.engine.begin() as conn:
+        conn.execute(table.insert(), values)
+
+
+def load(path, model, numbered, start, chunk_size):
+    """Stream one CSV into its table, skipping the first `start` rows."""
+
+    table = model.__table__
+    load_chunk = (copy_chunk if db.engine.dialect.name == 'postgresql'
+                  else insert_chunk)
+
+    with open(path, newline='') as f:
+        reader = csv.reader(f)
+        columns = next(reader)
+        rows = reader
+        if numbered:
+            columns = ['id'] + columns
+            rows = ([id] + row for id, row in enumerate(rows, start=1))
+
+        started = perf_counter()
+        done = start
+        for chunk in chunks(islice(rows, start, None), chunk_size):
+            load_chunk(columns, table, chunk)
+            done += len(chunk)
+            rate = (done - start) / (perf_counter() - started)
+            log(f'{table.name}: {done} rows ({rate:.0f} rows/s)')
+
+
+def reset_sequences(conn):
+    """Start id sequences after the explicitly numbered rows."""
+
+    if conn.dialect.name != 'postgresql':
+        return
+
+    for filename, model, numbered in SOURCES:
+        if numbered:
+            table = model.__table__.name
+            conn.execute(text(
+                f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), "
+                f"COALESCE(MAX(id), 1), MAX(id) IS NOT NULL) FROM {table}"))
+
+
+def log(message):
+    print(message, file=sys.stderr, flush=True)
+
+
+def read_checkpoint(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def write_checkpoint(path, checkpoint):
+    with open(path, 'w') as f:
+        json.dump(checkpoint, f)
+
+
+def seed(data_dir, chunk_size=CHUNK_SIZE, resume=False,
+         checkpoint_path=CHECKPOINT):
+    if resume:
+        checkpoint = read_checkpoint(checkpoint_path)
+    else:
+        db.drop_all()
+        db.create_all()
+        migrate.stamp(db.engine)
+        with db.engine.begin() as conn:
+            indexes, foreign_keys = deferred_schema(conn)
+            drop_deferred(conn, indexes, foreign_keys)
+        checkpoint = {'indexes': indexes, 'foreign_keys': foreign_keys,
+                      'loaded': {}}
+        write_checkpoint(checkpoint_path, checkpoint)
+
+    for filename, model, numbered in SOURCES:
+        table = model.__table__.name
+        if checkpoint['loaded'].get(table):
+            continue
+
+        with db.engine.connect() as conn:
+            start = loaded_rows(conn, model)
+        load(os.path.join(data_dir, filename), model, numbered, start,
+             chunk_size)
+
+        checkpoint['loaded'][table] = True
+        write_checkpoint(checkpoint_path, checkpoint)
+
+    with db.engine.begin() as conn:
+        restore_deferred(conn, checkpoint['indexes'],
+                         checkpoint['foreign_keys'])
+        reset_sequences(conn)
+
+    log('computing counters and timelines')
+    counters.reconcile()
+    timeline.rebuild()
+    db.session.commit()
 
+    os.remove(checkpoint_path)
 
-db.drop_all()
-db.create_all()
 
-with open('generator/users.csv') as users:
-    db.session.bulk_insert_mappings(User, DictReader(users))
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--data-dir', default='generator',
+                        help='directory holding the CSV files')
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE,
+                        help='rows per COPY or INSERT')
+    parser.add_argument('--resume', action='store_true',
+                        help='continue an interrupted load')
+    parser.add_argument('--checkpoint', default=CHECKPOINT,
+                        help='where to record progress for --resume')
+    args = parser.parse_args()
 
-with open('generator/messages.csv') as messages:
-    db.session.bulk_insert_mappings(Message, DictReader(messages))
+    with app.app_context():
+        seed(args.data_dir, args.chunk_size, args.resume, args.checkpoint)
 
-with open('generator/follows.csv') as follows:
-    db.session.bulk_insert_mappings(Follows, DictReader(follows))
 
-db.session.commit()
+if __name__ == '__main__':
+    main()
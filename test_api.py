@@ -0,0 +1,177 @@
+"""JSON API tests."""
+
+# run these tests like:
+#
+#    FLASK_ENV=production python -m unittest test_api.py
+
+
+import os
+from unittest import TestCase
+
+from models import db, Message, User
+
+# BEFORE we import our app, let's set an environmental variable
+# to use a different database for tests (we need to do this
+# before we import our app, since that will have already
+# connected to the database
+
+os.environ['DATABASE_URL'] = "postgresql:///warbler-test"
+
+
+# Now we can import app
+
+from app import app, CURR_USER_KEY
+import followgraph
+import ratelimit
+import usercache
+
+db.create_all()
+
+app.config['WTF_CSRF_ENABLED'] = False
+
+
+class ApiTestCase(TestCase):
+    """Test the /api/v1 endpoints."""
+
+    def setUp(self):
+        """Create test client, add sample data."""
+
+        db.drop_all()
+        db.create_all()
+        usercache.cache.clear()
+        followgraph.graph.clear()
+        ratelimit.limiter.reset()
+
+        self.client = app.test_client()
+
+        self.testuser = User.signup(username="testuser",
+                                    email="test@test.com",
+                                    password="testuser",
+                                    image_url=None)
+        db.session.commit()
+        self.testuser_id = self.testuser.id
+
+        with self.client.session_transaction() as sess:
+            sess[CURR_USER_KEY] = self.testuser_id
+
+        # More posts than the rate limit allows in a minute.
+        app.config['RATELIMIT_ENABLED'] = False
+        for i in range(105):
+            self.client.post("/messages/new", data={"text": f"Warble {i}"})
+        app.config['RATELIMIT_ENABLED'] = True
+
+    def test_timeline_pages(self):
+        """Does the timeline page through every message, newest first?"""
+
+        resp = self.client.get("/api/v1/timeline")
+        self.assertEqual(resp.status_code, 200)
+        first = resp.get_json()
+        self.assertEqual(len(first["messages"]), 100)
+        self.assertEqual(first["messages"][0]["text"], "Warble 104")
+        self.assertEqual(first["messages"][0]["username"], "testuser")
+
+        rest = self.client.get("/api/v1/timeline",
+                               query_string={"before": first["next"]}).get_json()
+        self.assertEqual([m["text"] for m in rest["messages"]],
+                         [f"Warble {i}" for i in range(4, -1, -1)])
+        self.assertIsNone(rest["next"])
+
+    def test_timeline_requires_login(self):
+        """Is the timeline refused to anonymous clients?"""
+
+        with self.client.session_transaction() as sess:
+            del sess[CURR_USER_KEY]
+
+        resp = self.client.get("/api/v1/timeline")
+        self.assertEqual(resp.status_code, 401)
+        self.assertIn("error", resp.get_json())
+
+    def test_field_selection(self):
+        """Does ?fields= limit what each item contains?"""
+
+        resp = self.client.get(f"/api/v1/users/{self.testuser_id}/messages",
+                               query_string={"fields": "id,text"})
+        self.assertEqual(set(resp.get_json()["messages"][0]), {"id", "text"})
+
+        resp = self.client.get(f"/api/v1/users/{self.testuser_id}",
+                               query_string={"fields": "username,messages_count"})
+        self.assertEqual(resp.get_json(),
+                         {"username": "testuser", "messages_count": 105})
+
+        resp = self.client.get(f"/api/v1/users/{self.testuser_id}",
+                               query_string={"fields": "password"})
+        self.assertEqual(resp.status_code, 400)
+
+    def test_message_and_missing_rows(self):
+        """Are single messages served, and missing rows 404s?"""
+
+        msg_id = db.session.query(Message.id).first().id
+        resp = self.client.get(f"/api/v1/messages/{msg_id}")
+        self.assertEqual(resp.get_json()["user_id"], self.testuser_id)
+
+        self.assertEqual(self.client.get("/api/v1/messages/0").status_code, 404)
+        self.assertEqual(self.client.get("/api/v1/users/0").status_code, 404)
+        self.assertEqual(
+            self.client.get("/api/v1/users/0/messages").status_code, 404)
+
+    def test_batch_follow_and_unfollow(self):
+        """Do batch follows report each id and keep counters in step?"""
+
+        others = [User.signup(username=f"other{i}",
+                              email=f"other{i}@test.com",
+                              password="password",
+                              image_url=None) for i in range(2)]
+        db.session.commit()
+        a, b = [user.id for user in others]
+
+        resp = self.client.post("/api/v1/following",
+                                json={"ids": [a, b, 0, self.testuser_id]})
+        self.assertEqual(resp.get_json()["results"], [
+            {"id": a, "result": "followed"},
+            {"id": b, "result": "followed"},
+            {"id": 0, "result": "not_found"},
+            {"id": self.testuser_id, "result": "self"},
+        ])
+
+        resp = self.client.post("/api/v1/following", json={"ids": [a]})
+        self.assertEqual(resp.get_json()["results"],
+                         [{"id": a, "result": "already_following"}])
+
+        resp = self.client.delete("/api/v1/following", json={"ids": [b, 0]})
+        self.assertEqual(resp.get_json()["results"], [
+            {"id": b, "result": "unfollowed"},
+            {"id": 0, "result": "not_following"},
+        ])
+
+        me = User.query.get(self.testuser_id)
+        self.assertEqual(me.following_count, 1)
+        self.assertEqual(User.query.get(a).followers_count, 1)
+        self.assertEqual(User.query.get(b).followers_count, 0)
+
+    def test_batch_like_and_unlike(self):
+        """Do batch likes skip own messages and count the rest?"""
+
+        other = User.signup(username="other", email="other@test.com",
+                            password="password", image_url=None)
+        db.session.commit()
+        db.session.add(Message(text="Not mine", user_id=other.id))
+        db.session.commit()
+        theirs = Message.query.filter_by(text="Not mine").one().id
+        mine = Message.query.filter_by(user_id=self.testuser_id).first().id
+
+        resp = self.client.post("/api/v1/likes",
+                                json={"ids": [theirs, mine, 0]})
+        self.assertEqual(resp.get_json()["results"], [
+            {"id": theirs, "result": "liked"},
+            {"id": mine, "result": "own_message"},
+            {"id": 0, "result": "not_found"},
+        ])
+        self.assertEqual(User.query.get(self.testuser_id).likes_count, 1)
+
+        resp = self.client.delete("/api/v1/likes", json={"ids": [theirs]})
+        self.assertEqual(resp.get_json()["results"],
+                         [{"id": theirs, "result": "unliked"}])
+        self.assertEqual(User.query.get(self.testuser_id).likes_count, 0)
+
+        resp = self.client.post("/api/v1/likes", json={"ids": "nope"})
+        self.assertEqual(resp.status_code, 400)
@@ -0,0 +1,103 @@
+"""Follow graph tests."""
+
+# run these tests like:
+#
+#    FLASK_ENV=production python -m unittest test_followgraph.py
+
+
+import os
+from unittest import TestCase
+
+from models import db, Follows, User
+
+os.environ['DATABASE_URL'] = "postgresql:///warbler-test"
+
+# Importing app connects db to the database.
+from app import app, CURR_USER_KEY
+import followgraph
+import ratelimit
+import usercache
+
+db.create_all()
+
+app.config['WTF_CSRF_ENABLED'] = False
+
+
+class FollowGraphTestCase(TestCase):
+    """Test the in-memory follow graph and the views that use it."""
+
+    def setUp(self):
+        db.drop_all()
+        db.create_all()
+        usercache.cache.clear()
+        followgraph.graph.clear()
+        ratelimit.limiter.reset()
+
+        users = [User.signup(username=f"user{i}", email=f"user{i}@test.com",
+                             password="password", image_url=None)
+                 for i in range(5)]
+        db.session.commit()
+        self.ids = [user.id for user in users]
+
+        a, b, c, d, e = self.ids
+        db.session.add_all([Follows(user_following_id=follower,
+                                    user_being_followed_id=followed)
+                            for follower, followed in
+                            [(a, b), (a, c), (a, d), (b, d), (c, d), (d, a)]])
+        db.session.commit()
+
+        self.client = app.test_client()
+
+    def test_queries(self):
+        """Are membership, degrees and intersections read from the table?"""
+
+        a, b, c, d, e = self.ids
+        graph = followgraph.graph
+
+        self.assertEqual(list(graph.following(a)), [b, c, d])
+        self.assertEqual(list(graph.followers(d)), [a, b, c])
+        self.assertEqual(list(graph.following(e)), [])
+        self.assertTrue(graph.is_following(a, c))
+        self.assertFalse(graph.is_following(c, a))
+        self.assertEqual(graph.followers_count(d), 3)
+        self.assertEqual(graph.following_among(a, [e, d, b]), {b, d})
+        self.assertEqual(graph.common_following(a, d), [b, c])
+
+    def test_updates(self):
+        """Do follows and unfollows show without reloading?"""
+
+        a, b, c, d, e = self.ids
+        graph = followgraph.graph
+        self.assertEqual(graph.following_count(e), 0)
+
+        graph.follow(e, [a, c])
+        graph.unfollow(a, [c])
+        self.assertEqual(list(graph.following(e)), [a, c])
+        self.assertEqual(list(graph.followers(c)), [e])
+        self.assertFalse(graph.is_following(a, c))
+
+        graph.remove_user(d)
+        self.assertEqual(list(graph.following(a)), [b])
+        self.assertEqual(list(graph.followers(a)), [e])
+
+    def test_follow_views(self):
+        """Do the follow views keep the graph and listing pages current?"""
+
+        a, b, c, d, e = self.ids
+        with self.client as client:
+            with client.session_transaction() as sess:
+                sess[CURR_USER_KEY] = e
+
+            client.post(f"/users/follow/{b}")
+            self.assertTrue(followgraph.graph.is_following(e, b))
+
+            html = client.get(f"/users/{e}/following").get_data(as_text=True)
+            self.assertIn("@user1", html)
+            self.assertIn("Unfollow", html)
+
+            client.post(f"/users/stop-following/{b}")
+            self.assertFalse(followgraph.graph.is_following(e, b))
+
+            html = client.get(f"/users/{d}/followers").get_data(as_text=True)
+            for username in ["@user0", "@user1", "@user2"]:
+                self.assertIn(username, html)
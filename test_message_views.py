@@ -8,7 +8,7 @@
 import os
 from unittest import TestCase
 
-from models import db, connect_db, Message, User
+from models import db, connect_db, Message, User, TimelineEntry
 
 # BEFORE we import our app, let's set an environmental variable
 # to use a different database for tests (we need to do this
@@ -21,6 +21,13 @@ os.environ['DATABASE_URL'] = "postgresql:///warbler-test"
 # Now we can import app
 
 from app import app, CURR_USER_KEY
+import followgraph
+import fragments
+import pagecache
+import ratelimit
+import search
+import usercache
+from querycount import count_queries
 
 # Create our tables (we do this here, so we only create the tables
 # once for all tests --- in each test, we'll delete the data
@@ -41,6 +48,12 @@ class MessageViewTestCase(TestCase):
 
         User.query.delete()
         Message.query.delete()
+        usercache.cache.clear()
+        followgraph.graph.clear()
+        fragments.cache.clear()
+        pagecache.cache.clear()
+        search.messages.clear()
+        ratelimit.limiter.reset()
 
         self.client = app.test_client()
 
@@ -71,3 +84,128 @@ class MessageViewTestCase(TestCase):
 
             msg = Message.query.one()
             self.assertEqual(msg.text, "Hello")
+
+    def test_add_message_fans_out_to_followers(self):
+        """Does a new message land on the author's and followers' timelines?"""
+
+        follower = User.signup(username="follower",
+                               email="follower@test.com",
+                               password="follower",
+                               image_url=None)
+        follower.following.append(self.testuser)
+        db.session.commit()
+        follower_id = follower.id
+
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = self.testuser.id
+
+            c.post("/messages/new", data={"text": "Fan me out"})
+
+            msg = Message.query.one()
+            owners = {entry.owner_id for entry in
+                      TimelineEntry.query.filter_by(message_id=msg.id)}
+            self.assertEqual(owners, {self.testuser.id, follower_id})
+
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = follower_id
+
+            resp = c.get("/")
+            self.assertIn(b"Fan me out", resp.data)
+
+    def test_user_messages_pagination(self):
+        """Does the profile page hand out a cursor to older messages?"""
+
+        for i in range(105):
+            self.testuser.messages.append(Message(text=f"Message {i}"))
+        db.session.commit()
+
+        with self.client as c:
+            first = c.get(f"/users/{self.testuser.id}?format=json").get_json()
+            self.assertEqual(len(first["messages"]), 100)
+            self.assertIsNotNone(first["next"])
+
+            second = c.get(f"/users/{self.testuser.id}",
+                           query_string={"format": "json",
+                                         "before": first["next"]}).get_json()
+            self.assertEqual(len(second["messages"]), 5)
+            self.assertIsNone(second["next"])
+
+            ids = [m["id"] for m in first["messages"] + second["messages"]]
+            self.assertEqual(len(set(ids)), 105)
+
+    def test_feed_query_count(self):
+        """Does the home feed load message authors without an N+1?"""
+
+        authors = [User.signup(username=f"author{i}",
+                               email=f"author{i}@test.com",
+                               password="testuser",
+                               image_url=None) for i in range(5)]
+        self.testuser.following.extend(authors)
+        db.session.commit()
+        author_ids = [author.id for author in authors]
+        reader_id = self.testuser.id
+
+        def post_as(user_id, text):
+            with self.client as c:
+                with c.session_transaction() as sess:
+                    sess[CURR_USER_KEY] = user_id
+                c.post("/messages/new", data={"text": text})
+
+        def feed_queries():
+            usercache.cache.clear()
+            with self.client as c:
+                with c.session_transaction() as sess:
+                    sess[CURR_USER_KEY] = reader_id
+                with count_queries() as queries:
+                    c.get("/")
+            return len(queries)
+
+        post_as(author_ids[0], "First")
+        # The follow graph loads once, on first use.
+        followgraph.graph.following(reader_id)
+        one_author = feed_queries()
+
+        for author_id in author_ids:
+            post_as(author_id, "Another")
+
+        self.assertEqual(feed_queries(), one_author)
+
+    def test_message_conditional_get(self):
+        """Does a repeat view of an unchanged message get a 304?"""
+
+        msg = Message(text="Cache me", user_id=self.testuser.id)
+        db.session.add(msg)
+        db.session.commit()
+
+        with self.client as c:
+            resp = c.get(f"/messages/{msg.id}")
+            self.assertEqual(resp.status_code, 200)
+            etag = resp.headers["ETag"]
+
+            resp = c.get(f"/messages/{msg.id}",
+                         headers={"If-None-Match": etag})
+            self.assertEqual(resp.status_code, 304)
+            self.assertEqual(resp.data, b"")
+
+    def test_message_search(self):
+        """Does /messages/search find messages containing every word?"""
+
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = self.testuser.id
+
+            for text in ["Warbling birds sing", "Birds of a feather",
+                         "Nothing to see here"]:
+                c.post("/messages/new", data={"text": text})
+
+            resp = c.get("/messages/search",
+                         query_string={"q": "birds", "format": "json"})
+            found = {m["text"] for m in resp.get_json()["messages"]}
+            self.assertEqual(found, {"Warbling birds sing",
+                                     "Birds of a feather"})
+
+            resp = c.get("/messages/search",
+                         query_string={"q": "birds sing", "format": "json"})
+            found = [m["text"] for m in resp.get_json()["messages"]]
+            self.assertEqual(found, ["Warbling birds sing"])
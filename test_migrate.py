@@ -0,0 +1,64 @@
+"""Schema migration tests."""
+
+# run these tests like:
+#
+#    FLASK_ENV=production python -m unittest test_migrate.py
+
+
+import os
+from unittest import TestCase
+
+from sqlalchemy import inspect
+
+from models import db
+
+os.environ['DATABASE_URL'] = "postgresql:///warbler-test"
+
+# Importing app connects db to the database.
+from app import app
+import migrate
+
+
+class MigrateTestCase(TestCase):
+    """Test applying and reverting migrations."""
+
+    def setUp(self):
+        db.drop_all()
+        db.create_all()
+        migrate.schema_migrations.drop(db.engine, checkfirst=True)
+
+    def tearDown(self):
+        migrate.schema_migrations.drop(db.engine, checkfirst=True)
+
+    def index_names(self, table):
+        return {index['name']
+                for index in inspect(db.engine).get_indexes(table)}
+
+    def test_upgrade_and_downgrade(self):
+        """Do migrations apply in order, record themselves, and revert?"""
+
+        versions = [migration.version for migration in migrate.available()]
+        self.assertEqual(versions, sorted(versions))
+
+        migrate.upgrade(db.engine, log=lambda message: None)
+        self.assertEqual(migrate.applied(db.engine), set(versions))
+        self.assertIn('ix_follows_user_following_id',
+                      self.index_names('follows'))
+
+        migrate.downgrade(db.engine, '0000', log=lambda message: None)
+        self.assertEqual(migrate.applied(db.engine), set())
+        self.assertNotIn('ix_follows_user_following_id',
+                         self.index_names('follows'))
+
+        # Upgrading again puts everything back.
+        migrate.upgrade(db.engine, log=lambda message: None)
+        self.assertIn('ix_likes_message_id', self.index_names('likes'))
+
+    def test_stamp(self):
+        """Does stamping mark every migration applied without running it?"""
+
+        migrate.stamp(db.engine)
+        self.assertEqual(migrate.applied(db.engine),
+                         {migration.version
+                          for migration in migrate.available()})
+        migrate.upgrade(db.engine, log=self.fail)
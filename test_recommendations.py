@@ -0,0 +1,97 @@
+"""Who-to-follow recommendation tests."""
+
+# run these tests like:
+#
+#    FLASK_ENV=production python -m unittest test_recommendations.py
+
+
+import os
+from unittest import TestCase
+
+from models import db, Follows, Message, Recommendation, User
+
+os.environ['DATABASE_URL'] = "postgresql:///warbler-test"
+
+# Importing app connects db to the database.
+from app import app, CURR_USER_KEY
+import counters
+import followgraph
+import fragments
+import ratelimit
+import recommendations
+import usercache
+
+db.create_all()
+
+app.config['WTF_CSRF_ENABLED'] = False
+
+
+class RecommendationsTestCase(TestCase):
+    """Test computing suggestions and the page that shows them."""
+
+    def setUp(self):
+        db.drop_all()
+        db.create_all()
+        usercache.cache.clear()
+        followgraph.graph.clear()
+        fragments.cache.clear()
+        ratelimit.limiter.reset()
+
+        users = [User.signup(username=f"user{i}", email=f"user{i}@test.com",
+                             password="password", image_url=None)
+                 for i in range(6)]
+        db.session.commit()
+        self.ids = [user.id for user in users]
+
+        # a follows b and c; both follow d, only c follows e; e posts
+        # more than d. f follows nobody.
+        a, b, c, d, e, f = self.ids
+        db.session.add_all([Follows(user_following_id=follower,
+                                    user_being_followed_id=followed)
+                            for follower, followed in
+                            [(a, b), (a, c), (b, d), (c, d), (c, e), (b, a)]])
+        db.session.add_all([Message(text="Hi", user_id=e) for i in range(5)])
+        db.session.commit()
+        counters.reconcile()
+        db.session.commit()
+
+        self.client = app.test_client()
+
+    def suggested(self, user_id):
+        return [rec.suggested_id for rec in
+                Recommendation.query.filter_by(user_id=user_id)
+                .order_by(Recommendation.rank)]
+
+    def test_compute(self):
+        """Are friends of friends ranked by overlap, then topped up?"""
+
+        a, b, c, d, e, f = self.ids
+        recommendations.compute(limit=3)
+        db.session.commit()
+
+        # d is followed by two of a's follows, e by one; a already follows
+        # every other popular account, so the top-up adds nobody.
+        self.assertEqual(self.suggested(a), [d, e])
+        # f follows nobody, and gets the most-followed accounts, with the
+        # active e ahead of the quiet a.
+        self.assertEqual(self.suggested(f), [d, e, a])
+
+    def test_suggestions_page(self):
+        """Does the page list suggestions, leaving out ones since followed?"""
+
+        a, b, c, d, e, f = self.ids
+        recommendations.compute()
+        db.session.commit()
+
+        with self.client as client:
+            with client.session_transaction() as sess:
+                sess[CURR_USER_KEY] = a
+
+            html = client.get("/users/suggestions").get_data(as_text=True)
+            self.assertIn("@user3", html)
+            self.assertIn("@user4", html)
+
+            client.post(f"/users/follow/{d}")
+            html = client.get("/users/suggestions").get_data(as_text=True)
+            self.assertNotIn("@user3", html)
+            self.assertIn("@user4", html)
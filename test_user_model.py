@@ -85,7 +85,7 @@ class UserModelTestCase(TestCase):
         # User should have no messages & no followers
         self.assertEqual(len(u.messages), 0,
                          "User should have no messages & no followers")
-        self.assertEqual(len(u.followers), 0,
+        self.assertEqual(u.followers.count(), 0,
                          "User should have no messages & no followers")
 
         # Does the repr method for the User model work as expected?
@@ -393,3 +393,33 @@ class UserModelTestCase(TestCase):
         except Exception as e:
             self.fail(
                 f"db.session.commit() raised {type(e)} unexpectedly when u2 tried to remove a like on a post")
+
+    def test_following_lookups(self):
+        """Do the set-based follow lookups agree with the relationships?"""
+        users = [User.signup(
+            username=f"testuser{i}",
+            password="PASSWORD",
+            email=f"test{i}@test.com",
+            image_url=User.image_url.default.arg,
+        ) for i in range(4)]
+        db.session.commit()
+
+        u0, u1, u2, u3 = users
+        u0.following.extend([u1, u2])
+        db.session.commit()
+
+        self.assertEqual(u0.following_ids(), {u1.id, u2.id},
+                         "following_ids doesn't match the users followed")
+        self.assertEqual(u0.following_among([u2.id, u3.id]), {u2.id},
+                         "following_among doesn't pick out followed users")
+        self.assertEqual(u3.following_among([u0.id, u1.id]), set(),
+                         "following_among found follows that don't exist")
+
+        # Is the cached set refreshed when the relationship changes?
+        u0.following.append(u3)
+        self.assertTrue(u0.is_following(u3),
+                        "is_following is stale after following a user")
+        u0.following.remove(u1)
+        self.assertFalse(u0.is_following(u1),
+                         "is_following is stale after unfollowing a user")
+        db.session.commit()
@@ -0,0 +1,305 @@
+"""User View tests."""
+
+# run these tests like:
+#
+#    FLASK_ENV=production python -m unittest test_user_views.py
+
+
+from datetime import datetime, timedelta
+import gzip
+import os
+import re
+from unittest import TestCase
+
+from models import db, Follows, Message, User, Likes
+
+# BEFORE we import our app, let's set an environmental variable
+# to use a different database for tests (we need to do this
+# before we import our app, since that will have already
+# connected to the database
+
+os.environ['DATABASE_URL'] = "postgresql:///warbler-test"
+
+
+# Now we can import app
+
+from app import app, CURR_USER_KEY
+import counters
+import followgraph
+import fragments
+import pagecache
+import passwords
+import ratelimit
+import search
+import usercache
+from querycount import count_queries
+
+# Create our tables (we do this here, so we only create the tables
+# once for all tests --- in each test, we'll delete the data
+# and create fresh new clean test data
+
+db.create_all()
+
+# Don't have WTForms use CSRF at all, since it's a pain to test
+
+app.config['WTF_CSRF_ENABLED'] = False
+
+
+class UserViewTestCase(TestCase):
+    """Test views for users."""
+
+    def setUp(self):
+        """Create test client, add sample data."""
+
+        db.drop_all()
+        db.create_all()
+        usercache.cache.clear()
+        followgraph.graph.clear()
+        fragments.cache.clear()
+        pagecache.cache.clear()
+        search.index.clear()
+        ratelimit.limiter.reset()
+
+        self.client = app.test_client()
+
+        self.u1 = User.signup(username="testuser1",
+                              email="test1@test.com",
+                              password="testuser",
+                              image_url=None)
+        self.u2 = User.signup(username="testuser2",
+                              email="test2@test.com",
+                              password="testuser",
+                              image_url=None)
+        db.session.commit()
+
+        self.u1_id = self.u1.id
+        self.u2_id = self.u2.id
+
+    def tearDown(self):
+        db.session.rollback()
+        return super().tearDown()
+
+    def login(self, c, user_id):
+        with c.session_transaction() as sess:
+            sess[CURR_USER_KEY] = user_id
+
+    def counts(self, user_id):
+        db.session.expire_all()
+        u = User.query.get(user_id)
+        return (u.messages_count, u.following_count,
+                u.followers_count, u.likes_count)
+
+    def test_counters_follow_the_views(self):
+        """Do follow, message and like views keep the counters current?"""
+
+        with self.client as c:
+            self.login(c, self.u1_id)
+            c.post(f"/users/follow/{self.u2_id}")
+            c.post("/messages/new", data={"text": "Hello"})
+
+            self.assertEqual(self.counts(self.u1_id), (1, 1, 0, 0))
+            self.assertEqual(self.counts(self.u2_id), (0, 0, 1, 0))
+
+            msg_id = Message.query.one().id
+            self.login(c, self.u2_id)
+            c.post(f"/users/add_like/{msg_id}")
+            self.assertEqual(self.counts(self.u2_id), (0, 0, 1, 1))
+
+            c.post(f"/users/remove_like/{msg_id}")
+            self.assertEqual(self.counts(self.u2_id), (0, 0, 1, 0))
+
+            self.login(c, self.u1_id)
+            c.post(f"/users/stop-following/{self.u2_id}")
+            c.post(f"/messages/{msg_id}/delete")
+            self.assertEqual(self.counts(self.u1_id), (0, 0, 0, 0))
+            self.assertEqual(self.counts(self.u2_id), (0, 0, 0, 0))
+
+    def test_likes_page(self):
+        """Does /users/<id>/likes list liked messages, with like counts?"""
+
+        msg = Message(text="Likeable", user_id=self.u2_id)
+        other = Message(text="Not liked", user_id=self.u2_id)
+        db.session.add_all([msg, other])
+        db.session.commit()
+        msg_id = msg.id
+
+        with self.client as c:
+            self.login(c, self.u1_id)
+            c.post(f"/users/add_like/{msg_id}")
+            c.post(f"/users/add_like/{msg_id}")
+
+            db.session.expire_all()
+            self.assertEqual(Message.query.get(msg_id).like_count, 1)
+
+            resp = c.get(f"/users/{self.u1_id}/likes")
+            self.assertIn("Likeable", str(resp.data))
+            self.assertNotIn("Not liked", str(resp.data))
+
+            resp = c.get(f"/users/{self.u1_id}/likes?format=json")
+            self.assertEqual(resp.get_json()["messages"][0]["like_count"], 1)
+
+            c.post(f"/users/remove_like/{msg_id}")
+            db.session.expire_all()
+            self.assertEqual(Message.query.get(msg_id).like_count, 0)
+
+    def test_followers_pages(self):
+        """Are followers listed most recent first, a page at a time?"""
+
+        followers = [User(username=f"fan{i}", email=f"fan{i}@test.com",
+                          password="unused") for i in range(105)]
+        db.session.add_all(followers)
+        db.session.flush()
+        start = datetime(2020, 1, 1)
+        db.session.add_all([Follows(user_following_id=user.id,
+                                    user_being_followed_id=self.u2_id,
+                                    created_at=start + timedelta(minutes=i))
+                            for i, user in enumerate(followers)])
+        db.session.commit()
+
+        def listed(html):
+            return re.findall(r'<p>@(\w+)</p>', html)
+
+        with self.client as c:
+            self.login(c, self.u1_id)
+            html = c.get(f"/users/{self.u2_id}/followers").get_data(
+                as_text=True)
+            first = listed(html)
+            self.assertEqual(len(first), 100)
+            self.assertEqual(first[:2], ["fan104", "fan103"])
+
+            older = re.search(r'href="(\?before=[^"]+)"', html).group(1)
+            html = c.get(f"/users/{self.u2_id}/followers{older}").get_data(
+                as_text=True)
+            self.assertEqual(listed(html),
+                             ["fan4", "fan3", "fan2", "fan1", "fan0"])
+            self.assertNotIn("?before=", html)
+
+    def test_reconcile_counters(self):
+        """Does reconcile recompute counters written outside the views?"""
+
+        self.u1.following.append(self.u2)
+        msg = Message(text="Hello")
+        self.u2.messages.append(msg)
+        db.session.commit()
+        db.session.add(Likes(user_id=self.u1_id, message_id=msg.id))
+        db.session.commit()
+
+        counters.reconcile()
+        db.session.commit()
+
+        self.assertEqual(self.counts(self.u1_id), (0, 1, 0, 1))
+        self.assertEqual(self.counts(self.u2_id), (1, 0, 1, 0))
+
+    def test_current_user_cache(self):
+        """Is the logged-in user cached, and refreshed by their own changes?"""
+
+        with self.client as c:
+            self.login(c, self.u1_id)
+            c.get("/")
+            snapshot = usercache.cache.get(self.u1_id)
+            self.assertIs(usercache.cache.get(self.u1_id), snapshot)
+            self.assertEqual(snapshot.following_ids, frozenset())
+
+            c.post(f"/users/follow/{self.u2_id}")
+            self.assertIsNot(usercache.cache.get(self.u1_id), snapshot)
+            self.assertEqual(usercache.cache.get(self.u1_id).following_ids,
+                             {self.u2_id})
+
+    def test_profile_edit_refreshes_cached_fragments(self):
+        """Do cached message items and cards show a renamed user?"""
+
+        db.session.add(Message(text="Hello", user_id=self.u1_id))
+        db.session.commit()
+
+        with self.client as c:
+            self.login(c, self.u1_id)
+            self.assertIn("@testuser1", c.get(f"/users/{self.u1_id}")
+                          .get_data(as_text=True))
+            self.assertIn("@testuser1", c.get("/users")
+                          .get_data(as_text=True))
+
+            c.post("/users/profile", data={"email": "test1@test.com",
+                                           "username": "renamed",
+                                           "password": "testuser"})
+
+            html = c.get(f"/users/{self.u1_id}").get_data(as_text=True)
+            self.assertNotIn("@testuser1", html)
+            self.assertIn("@renamed", html)
+            self.assertIn("@renamed", c.get("/users").get_data(as_text=True))
+
+    def test_anonymous_page_cache(self):
+        """Are public pages cached for anonymous visitors until they change?"""
+
+        profile = f"/users/{self.u1_id}"
+        first = self.client.get(profile).get_data(as_text=True)
+
+        with count_queries() as queries:
+            resp = self.client.get(profile, headers={"Accept-Encoding": "gzip"})
+        self.assertEqual(queries, [])
+        self.assertEqual(resp.content_encoding, "gzip")
+        self.assertEqual(gzip.decompress(resp.data).decode(), first)
+
+        with self.client as c:
+            self.login(c, self.u1_id)
+            c.post("/messages/new", data={"text": "Fresh warble"})
+            self.assertIn("Fresh warble", c.get(profile).get_data(as_text=True))
+
+        anonymous = app.test_client()
+        self.assertIn("Fresh warble",
+                      anonymous.get(profile).get_data(as_text=True))
+
+    def test_user_search(self):
+        """Does /users?q= find partial matches, prefix matches first?"""
+
+        for username in ["bobcat", "catherine", "dogperson"]:
+            User.signup(username=username,
+                        email=f"{username}@test.com",
+                        password="testuser",
+                        image_url=None)
+        db.session.commit()
+
+        with self.client as c:
+            html = c.get("/users?q=CAT").get_data(as_text=True)
+
+            self.assertIn("@catherine", html)
+            self.assertIn("@bobcat", html)
+            self.assertNotIn("@dogperson", html)
+            self.assertLess(html.index("@catherine"), html.index("@bobcat"))
+
+    def test_login_rehashes_password_at_new_cost(self):
+        """Does logging in upgrade a hash made at an old bcrypt cost?"""
+
+        old_rounds = passwords.hasher.rounds
+        user_id = self.u1.id
+        self.assertEqual(passwords.rounds_of(self.u1.password), old_rounds)
+
+        passwords.hasher.rounds = 4
+        try:
+            resp = self.client.post("/login", data={"username": "testuser1",
+                                                    "password": "testuser"})
+            self.assertEqual(resp.status_code, 302)
+        finally:
+            passwords.hasher.rounds = old_rounds
+
+        user = User.query.get(user_id)
+        self.assertEqual(passwords.rounds_of(user.password), 4)
+        self.assertTrue(passwords.hasher.check(user.password, "testuser"))
+
+    def test_login_attempts_are_limited(self):
+        """Are repeated logins for one username refused before bcrypt?"""
+
+        checks = []
+        check = passwords.hasher.check
+        passwords.hasher.check = lambda *args: checks.append(args) or False
+        try:
+            statuses = [
+                self.client.post("/login",
+                                 data={"username": "testuser1",
+                                       "password": "incorrect"}).status_code
+                for i in range(ratelimit.LOGIN_PER_USERNAME.count + 1)]
+        finally:
+            passwords.hasher.check = check
+
+        self.assertEqual(statuses[-1], 429)
+        self.assertNotIn(429, statuses[:-1])
+        self.assertEqual(len(checks), ratelimit.LOGIN_PER_USERNAME.count)
@@ -0,0 +1,263 @@
+"""Materialized home timelines for Warbler.
+
+Posting a message copies a pointer to it into the timeline of its author and
+of every follower (fan-out-on-write), so the home page reads one indexed range
+of `timeline_entries` instead of gathering followed users on every request.
+
+Authors with more than TIMELINE_FANOUT_LIMIT followers are not fanned out;
+their messages are merged in when a follower's timeline is read
+(fan-out-on-read), so one popular post never writes millions of rows.
+"""
+
+from heapq import merge
+
+from flask import current_app
+from sqlalchemy import literal, select
+
+from models import db, Follows, Likes, Message, TimelineEntry, User
+from pagination import older_than
+import followgraph
+
+DEFAULT_FANOUT_LIMIT = 10000
+
+# How many of a user's recent messages are copied into a new follower's
+# timeline when the follow is made.
+FOLLOW_BACKFILL = 100
+
+ENTRY_COLUMNS = ['owner_id', 'message_id', 'author_id', 'timestamp']
+
+
+def fanout_limit():
+    """Follower count above which an author's posts are read, not written."""
+
+    return current_app.config.get('TIMELINE_FANOUT_LIMIT', DEFAULT_FANOUT_LIMIT)
+
+
+def popular_authors():
+    """Subquery of ids of users whose posts are merged in at read time."""
+
+    return select(User.id).where(User.followers_count > fanout_limit())
+
+
+def is_fanout_on_read(user_id):
+    """Is `user_id` popular enough that their posts skip fan-out?"""
+
+    followers = (db.session.query(User.followers_count)
+                 .filter(User.id == user_id)
+                 .scalar())
+    return followers > fanout_limit()
+
+
+def _insert_entries(query):
+    db.session.execute(
+        TimelineEntry.__table__.insert().from_select(ENTRY_COLUMNS, query))
+
+
+def fan_out_message(msg):
+    """Write `msg` into the timelines of its author and their followers.
+
+    `msg` must already be flushed (so it has an id). Runs in the caller's
+    transaction; the caller commits.
+    """
+
+    db.session.add(TimelineEntry(owner_id=msg.user_id,
+                                 message_id=msg.id,
+                                 author_id=msg.user_id,
+                                 timestamp=msg.timestamp))
+
+    if is_fanout_on_read(msg.user_id):
+        return
+
+    _insert_entries(
+        select(Follows.user_following_id,
+               literal(msg.id, db.Integer),
+               literal(msg.user_id, db.Integer),
+               literal(msg.timestamp, db.DateTime))
+        .where(Follows.user_being_followed_id == msg.user_id)
+        .where(Follows.user_following_id != msg.user_id))
+
+
+def remove_message(message_id):
+    """Remove a message from every timeline it was fanned out to."""
+
+    TimelineEntry.query.filter_by(message_id=message_id).delete()
+
+
+def add_follow(follower_id, followed_id):
+    """Copy the recent messages of `followed_id` into the follower's timeline."""
+
+    add_follows(follower_id, [followed_id])
+
+
+def add_follows(follower_id, followed_ids):
+    """Copy the recent messages of each of `followed_ids` into the
+    follower's timeline."""
+
+    backfilled = (db.session.query(User.id)
+                  .filter(User.id.in_(followed_ids),
+                          User.id != follower_id,
+                          User.followers_count <= fanout_limit()))
+
+    for (followed_id,) in backfilled:
+        _insert_entries(
+            select(literal(follower_id, db.Integer),
+                   Message.id,
+                   Message.user_id,
+                   Message.timestamp)
+            .where(Message.user_id == followed_id)
+            .order_by(Message.timestamp.desc())
+            .limit(FOLLOW_BACKFILL))
+
+
+def remove_follow(follower_id, followed_id):
+    """Drop the messages of `followed_id` from the follower's timeline."""
+
+    remove_follows(follower_id, [followed_id])
+
+
+def remove_follows(follower_id, followed_ids):
+    """Drop the messages of each of `followed_ids` from the follower's
+    timeline."""
+
+    (TimelineEntry.query
+     .filter(TimelineEntry.owner_id == follower_id,
+             TimelineEntry.author_id.in_(followed_ids),
+             TimelineEntry.author_id != follower_id)
+     .delete(synchronize_session=False))
+
+
+def messages_query():
+    """Messages with their authors' card columns, the default rows for
+    `home_timeline()` and `user_timeline()`."""
+
+    return Message.query.options(Message.with_author())
+
+
+def home_timeline(user_id, before=None, limit=100, messages=None):
+    """Return the `limit` most recent messages on `user_id`'s home timeline.
+
+    With a (timestamp, id) `before` key, only messages older than it are
+    returned. Materialized entries come from a single range scan; messages
+    from followed fan-out-on-read authors are fetched separately and merged.
+
+    `messages` is the query to select rows from (by default Message
+    objects with their authors); pass a query for columns of Message to
+    get column tuples instead. Its rows need `timestamp` and `id`.
+    """
+
+    if messages is None:
+        messages = messages_query()
+
+    materialized = (messages
+                    .join(TimelineEntry, TimelineEntry.message_id == Message.id)
+                    .filter(TimelineEntry.owner_id == user_id))
+    materialized = (older_than(materialized,
+                               TimelineEntry.timestamp,
+                               TimelineEntry.message_id,
+                               before)
+                    .order_by(TimelineEntry.timestamp.desc(),
+                              TimelineEntry.message_id.desc())
+                    .limit(limit)
+                    .all())
+
+    # Followed authors whose posts are read, not written, from the follow
+    # graph; most users follow none, and skip the second query.
+    graph = followgraph.graph
+    followed_popular = [id for id in graph.following(user_id)
+                        if graph.followers_count(id) > fanout_limit()]
+    if not followed_popular:
+        return materialized
+
+    pulled = (older_than(messages
+                         .filter(Message.user_id.in_(followed_popular)),
+                         Message.timestamp,
+                         Message.id,
+                         before)
+              .order_by(Message.timestamp.desc(), Message.id.desc())
+              .limit(limit)
+              .all())
+
+    if not pulled:
+        return materialized
+
+    # An author may have crossed the fan-out limit after some of their
+    # posts were written out, so drop duplicates while merging.
+    merged = []
+    seen = set()
+    newest_first = merge(materialized, pulled,
+                         key=lambda msg: (msg.timestamp, msg.id), reverse=True)
+    for msg in newest_first:
+        if msg.id not in seen:
+            seen.add(msg.id)
+            merged.append(msg)
+        if len(merged) == limit:
+            break
+
+    return merged
+
+
+def user_timeline(user_id, before=None, limit=100, messages=None):
+    """Return the `limit` most recent messages posted by `user_id`.
+
+    `before` and `messages` are as for `home_timeline()`.
+    """
+
+    if messages is None:
+        messages = messages_query()
+
+    return (older_than(messages.filter(Message.user_id == user_id),
+                       Message.timestamp,
+                       Message.id,
+                       before)
+            .order_by(Message.timestamp.desc(), Message.id.desc())
+            .limit(limit)
+            .all())
+
+
+def liked_by(user_id, before=None, limit=100, messages=None):
+    """Return the `limit` most recent messages that `user_id` likes.
+
+    `before` and `messages` are as for `home_timeline()`.
+    """
+
+    if messages is None:
+        messages = messages_query()
+
+    liked = messages.join(Likes, Likes.message_id == Message.id)
+    return (older_than(liked.filter(Likes.user_id == user_id),
+                       Message.timestamp,
+                       Message.id,
+                       before)
+            .order_by(Message.timestamp.desc(), Message.id.desc())
+            .limit(limit)
+            .all())
+
+
+def rebuild(user_id=None):
+    """Rebuild materialized timelines from the messages and follows tables.
+
+    Rebuilds every timeline, or only `user_id`'s when given. Runs in the
+    caller's transaction; the caller commits.
+    """
+
+    entries = TimelineEntry.query
+    own = select(Message.user_id,
+                 Message.id,
+                 Message.user_id.label('author_id'),
+                 Message.timestamp)
+    followed = (select(Follows.user_following_id,
+                       Message.id,
+                       Message.user_id,
+                       Message.timestamp)
+                .join(Message, Message.user_id == Follows.user_being_followed_id)
+                .where(Follows.user_following_id != Follows.user_being_followed_id)
+                .where(Message.user_id.not_in(popular_authors())))
+
+    if user_id is not None:
+        entries = entries.filter_by(owner_id=user_id)
+        own = own.where(Message.user_id == user_id)
+        followed = followed.where(Follows.user_following_id == user_id)
+
+    entries.delete()
+    _insert_entries(own)
+    _insert_entries(followed)
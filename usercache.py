@@ -0,0 +1,119 @@
+"""Cache of logged-in users, so most requests skip loading the user row.
+
+`add_user_to_g()` puts a `CurrentUser` snapshot on `g.user` instead of a
+User model. The snapshot holds what the templates and views need about the
+current user -- id, names, images and counters -- and is kept in a small
+in-process LRU cache with a TTL. Who they follow is looked up in the
+follow graph (see followgraph.py).
+
+Views that change any of that for the current user call `invalidate()`
+once they commit. Changes made by *other* users (e.g. gaining a follower)
+show up when the entry expires, so followers_count may lag by up to the
+TTL.
+"""
+
+from collections import OrderedDict
+from threading import Lock
+from time import monotonic
+
+from models import User
+import followgraph
+
+DEFAULT_SIZE = 1024
+DEFAULT_TTL = 60
+
+
+class CurrentUser:
+    """Snapshot of the logged-in user, in place of a User on `g.user`."""
+
+    __slots__ = ('id', 'username', 'image_url', 'header_image_url',
+                 'messages_count', 'following_count', 'followers_count',
+                 'likes_count', 'expires')
+
+    def __init__(self, user, ttl):
+        self.id = user.id
+        self.username = user.username
+        self.image_url = user.image_url
+        self.header_image_url = user.header_image_url
+        self.messages_count = user.messages_count
+        self.following_count = user.following_count
+        self.followers_count = user.followers_count
+        self.likes_count = user.likes_count
+        self.expires = monotonic() + ttl
+
+    def __repr__(self):
+        return f"<CurrentUser #{self.id}: {self.username}>"
+
+    @property
+    def following_ids(self):
+        return frozenset(followgraph.graph.following(self.id))
+
+    def is_following(self, other_user):
+        """Is this user following `other_user`?"""
+
+        return followgraph.graph.is_following(self.id, other_user.id)
+
+    def following_among(self, user_ids):
+        """Subset of `user_ids` that this user follows."""
+
+        return followgraph.graph.following_among(self.id, user_ids)
+
+    def load(self):
+        """Fetch the full User row, for views that need to change it."""
+
+        return User.query.get(self.id)
+
+
+class UserCache:
+    """LRU cache of `CurrentUser` snapshots, keyed by user id."""
+
+    def __init__(self, size=DEFAULT_SIZE, ttl=DEFAULT_TTL):
+        self.size = size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = Lock()
+
+    def init_app(self, app):
+        self.size = app.config.setdefault('USER_CACHE_SIZE', self.size)
+        self.ttl = app.config.setdefault('USER_CACHE_TTL', self.ttl)
+
+    def get(self, user_id):
+        """Return the snapshot for `user_id`, loading it on a miss.
+
+        Returns None if there is no such user.
+        """
+
+        with self._lock:
+            snapshot = self._entries.get(user_id)
+            if snapshot is not None:
+                if snapshot.expires > monotonic():
+                    self._entries.move_to_end(user_id)
+                    return snapshot
+                del self._entries[user_id]
+
+        user = User.query.get(user_id)
+        if user is None:
+            return None
+
+        snapshot = CurrentUser(user, self.ttl)
+
+        with self._lock:
+            self._entries[user_id] = snapshot
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+        return snapshot
+
+    def invalidate(self, user_id):
+        """Forget `user_id`'s snapshot; the next request reloads it."""
+
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+cache = UserCache()